@@ -59,7 +59,8 @@ setup(name=name,
         'trytond.res': ['tryton.cfg', '*.xml', 'view/*.xml', 'locale/*.po'],
         'trytond.tests': ['tryton.cfg', '*.xml'],
         },
-    scripts=['bin/trytond', 'bin/trytond-admin', 'bin/trytond-cron'],
+    scripts=['bin/trytond', 'bin/trytond-admin', 'bin/trytond-cron',
+        'bin/trytond-cache'],
     classifiers=[
         'Development Status :: 5 - Production/Stable',
         'Environment :: No Input/Output (Daemon)',
@@ -97,7 +98,7 @@ setup(name=name,
         'Genshi',
         'python-dateutil',
         'polib',
-        'python-sql >= 0.4',
+        'python-sql >= 0.7',
         'werkzeug',
         'wrapt',
         ],
@@ -45,7 +45,8 @@ def run(options):
                 lang = [x[0] for x in cursor.fetchall()]
         else:
             lang = None
-        Pool(db_name).init(update=options.update, lang=lang)
+        Pool(db_name).init(update=options.update, lang=lang,
+            force=options.force)
 
     for db_name in options.database_names:
         if init[db_name]:
@@ -172,3 +172,46 @@ class DatabaseInterface(object):
     def has_multirow_insert(self):
         'Return True if database supports multirow insert'
         return False
+
+    def has_array(self):
+        'Return True if database supports comparison with ANY of an array'
+        return False
+
+    def has_window_functions(self):
+        'Return True if database supports window functions'
+        return False
+
+    def has_update_from(self):
+        'Return True if database supports FROM clause in UPDATE statements'
+        return False
+
+    def has_channel(self):
+        '''
+        Return True if database supports LISTEN/NOTIFY on channels.
+
+        :return: a boolean
+        '''
+        return False
+
+    def use_primary(self):
+        '''
+        Route the next readonly transactions to the primary server because
+        the replicas may not have replayed a write or a cache reset yet.
+        '''
+        pass
+
+    def is_stale(self, connection):
+        '''
+        Return True if the connection may not see the last write or cache
+        reset, so its reads must not be cached.
+        '''
+        return False
+
+    def has_server_cursor(self):
+        '''
+        Return True if the connection creates server-side cursors when the
+        cursor is named.
+
+        :return: a boolean
+        '''
+        return False
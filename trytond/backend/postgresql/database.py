@@ -5,6 +5,7 @@ import logging
 import re
 import os
 import urllib
+import threading
 from decimal import Decimal
 
 try:
@@ -13,9 +14,11 @@ try:
 except ImportError:
     pass
 from psycopg2 import connect
-from psycopg2.pool import ThreadedConnectionPool, PoolError
+from psycopg2.pool import PoolError
 from psycopg2.extensions import ISOLATION_LEVEL_REPEATABLE_READ
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, \
+    TRANSACTION_STATUS_UNKNOWN
 from psycopg2.extensions import register_type, register_adapter
 from psycopg2.extensions import UNICODE, AsIs
 try:
@@ -51,6 +54,226 @@ def replace_special_values(s, **mapping):
     return s
 
 
+class ConnectionPool(object):
+    """
+    A thread-safe pool of connections which records its usage.
+    Idle connections are kept up to maxconn and those unused since
+    idle_timeout seconds are closed by trim down to minconn.
+    """
+
+    def __init__(self, name, minconn, maxconn, dsn, idle_timeout=0):
+        self.name = name
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.dsn = dsn
+        self.idle_timeout = idle_timeout
+        self.closed = False
+        self._idle = []  # list of (timestamp, connection)
+        self._used = {}
+        self._lock = threading.Lock()
+        self._last_trim = time.time()
+        self.high_water = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.
+        self.max_wait_time = 0.
+        for i in range(self.minconn):
+            self._idle.append((time.time(), connect(self.dsn)))
+
+    def getconn(self):
+        with self._lock:
+            if self.closed:
+                raise PoolError('connection pool is closed')
+            if self._idle:
+                # Use the most recent connection to let the others idle
+                _, conn = self._idle.pop()
+            elif len(self._used) < self.maxconn:
+                conn = None
+            else:
+                raise PoolError('connection pool exhausted')
+            if conn is None:
+                # Reserve the slot before connecting outside the lock
+                key = object()
+                self._used[key] = None
+        if conn is None:
+            try:
+                conn = connect(self.dsn)
+            finally:
+                with self._lock:
+                    del self._used[key]
+        with self._lock:
+            self._used[id(conn)] = conn
+            self.checkouts += 1
+            self.high_water = max(self.high_water, len(self._used))
+        return conn
+
+    def putconn(self, conn, close=False):
+        if not close and not conn.closed:
+            status = conn.get_transaction_status()
+            if status == TRANSACTION_STATUS_UNKNOWN:
+                close = True
+            elif status != TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        with self._lock:
+            if self._used.pop(id(conn), None) is None:
+                raise PoolError('trying to put unkeyed connection')
+            if not self.closed and not close and not conn.closed:
+                self._idle.append((time.time(), conn))
+                conn = None
+        if conn is not None and not conn.closed:
+            conn.close()
+        if (self.idle_timeout
+                and time.time() - self._last_trim > self.idle_timeout):
+            self.trim()
+
+    def record_wait(self, delay, exhausted=False):
+        "Record the time waited for a connection"
+        with self._lock:
+            if exhausted:
+                self.waits += 1
+            self.wait_time += delay
+            self.max_wait_time = max(self.max_wait_time, delay)
+
+    def trim(self):
+        "Close the connections idle since more than idle_timeout"
+        now = time.time()
+        to_close = []
+        with self._lock:
+            self._last_trim = now
+            while len(self._idle) > self.minconn:
+                timestamp, conn = self._idle[0]
+                if now - timestamp < self.idle_timeout:
+                    break
+                to_close.append(self._idle.pop(0)[1])
+        for conn in to_close:
+            conn.close()
+        logger.info('connection pool of "%s": %s', self.name,
+            ', '.join('%s=%s' % i for i in sorted(self.stats().iteritems())))
+        return len(to_close)
+
+    def stats(self):
+        "Return the usage of the pool"
+        with self._lock:
+            return {
+                'size': len(self._idle) + len(self._used),
+                'in_use': len(self._used),
+                'idle': len(self._idle),
+                'high_water': self.high_water,
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_time': self.wait_time,
+                'max_wait_time': self.max_wait_time,
+                }
+
+    def __contains__(self, conn):
+        with self._lock:
+            return id(conn) in self._used
+
+    def closeall(self):
+        with self._lock:
+            connections = [c for _, c in self._idle] + [
+                c for c in self._used.itervalues() if c is not None]
+            self._idle = []
+            self._used = {}
+            self.closed = True
+        for conn in connections:
+            if not conn.closed:
+                conn.close()
+
+
+class ReplicaPool(ConnectionPool):
+    """
+    A pool of connections to a standby server which is available only if its
+    replication lag is lower than max_lag seconds.
+    The lag is checked at most every check_interval seconds with a dedicated
+    connection.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.max_lag = kwargs.pop('max_lag', 30)
+        self.check_interval = kwargs.pop('check_interval', 10)
+        super(ReplicaPool, self).__init__(*args, **kwargs)
+        self._checked = None
+        self._available = False
+        self._check_lock = threading.Lock()
+        self._probe = None
+        self._checkout_times = {}
+
+    @property
+    def available(self):
+        now = time.time()
+        with self._check_lock:
+            if (self._checked is not None
+                    and now - self._checked <= self.check_interval):
+                return self._available
+            # The other threads use the previous state during the check
+            self._checked = now
+        available = self.check()
+        with self._check_lock:
+            self._available = available
+        return available
+
+    def getconn(self):
+        conn = super(ReplicaPool, self).getconn()
+        with self._lock:
+            self._checkout_times[id(conn)] = time.time()
+        return conn
+
+    def putconn(self, conn, close=False):
+        with self._lock:
+            self._checkout_times.pop(id(conn), None)
+        super(ReplicaPool, self).putconn(conn, close=close)
+
+    def checkout_time(self, conn):
+        "Return the time at which the connection was taken from the pool"
+        with self._lock:
+            return self._checkout_times.get(id(conn))
+
+    def check(self):
+        "Return True if the replication lag is lower than max_lag"
+        conn = self._probe
+        try:
+            if conn is None or conn.closed:
+                conn = self._probe = connect(self.dsn)
+        except Exception:
+            logger.warning('replica "%s" is not reachable', self.name,
+                exc_info=True)
+            return False
+        if conn.server_version >= 100000:
+            receive, replay = ('pg_last_wal_receive_lsn',
+                'pg_last_wal_replay_lsn')
+        else:
+            receive, replay = ('pg_last_xlog_receive_location',
+                'pg_last_xlog_replay_location')
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT CASE '
+                'WHEN NOT pg_is_in_recovery() THEN 0 '
+                'WHEN %s() = %s() THEN 0 '
+                'ELSE EXTRACT(EPOCH FROM '
+                'now() - pg_last_xact_replay_timestamp()) END'
+                % (receive, replay))
+            lag, = cursor.fetchone()
+            conn.rollback()
+        except Exception:
+            logger.warning('replica "%s" check failed', self.name,
+                exc_info=True)
+            self._probe = None
+            if not conn.closed:
+                conn.close()
+            return False
+        if lag is None or lag > self.max_lag:
+            logger.warning('replica "%s" lags %ss behind', self.name, lag)
+            return False
+        return True
+
+    def closeall(self):
+        super(ReplicaPool, self).closeall()
+        conn, self._probe = self._probe, None
+        if conn is not None and not conn.closed:
+            conn.close()
+
+
 class Database(DatabaseInterface):
 
     _databases = {}
@@ -58,7 +281,14 @@ class Database(DatabaseInterface):
     _list_cache = None
     _list_cache_timestamp = None
     _version_cache = {}
+    _has_returning = None
+    _replicas = ()
+    _replica_index = 0
+    _replica_delay = 0
+    _primary_until = 0
     flavor = Flavor(ilike=True)
+    # reduce_ids uses a single array parameter
+    IN_MAX = 2000
 
     def __new__(cls, name='template1'):
         if name in cls._databases:
@@ -72,8 +302,8 @@ class Database(DatabaseInterface):
         self._current_user = None
 
     @classmethod
-    def dsn(cls, name):
-        uri = parse_uri(config.get('database', 'uri'))
+    def dsn(cls, name, uri=None):
+        uri = parse_uri(uri or config.get('database', 'uri'))
         assert uri.scheme == 'postgresql'
         host = uri.hostname and "host=%s" % uri.hostname or ''
         port = uri.port and "port=%s" % uri.port or ''
@@ -89,13 +319,61 @@ class Database(DatabaseInterface):
         logger.info('connect to "%s"', self.name)
         minconn = config.getint('database', 'minconn', default=1)
         maxconn = config.getint('database', 'maxconn', default=64)
-        self._connpool = ThreadedConnectionPool(
-            minconn, maxconn, self.dsn(self.name))
+        idle_timeout = config.getint('database', 'idle_timeout', default=0)
+        self._connpool = ConnectionPool(self.name,
+            minconn, maxconn, self.dsn(self.name), idle_timeout=idle_timeout)
+        max_lag = config.getint('database', 'replica_max_lag', default=30)
+        check_interval = config.getint(
+            'database', 'replica_check_interval', default=10)
+        replicas = config.get('database', 'replicas', default='')
+        self._replicas = [ReplicaPool(
+                '%s on %s' % (self.name, parse_uri(uri).hostname),
+                0, maxconn, self.dsn(self.name, uri),
+                idle_timeout=idle_timeout, max_lag=max_lag,
+                check_interval=check_interval)
+            for uri in replicas.replace(',', ' ').split()]
+        # The lag of an available replica may have grown since its check
+        self._replica_delay = max_lag + check_interval
         return self
 
+    def use_primary(self):
+        if self._replicas:
+            self._primary_until = time.time() + self._replica_delay
+
+    def is_stale(self, connection):
+        for replica in self._replicas:
+            checkout_time = replica.checkout_time(connection)
+            if checkout_time is not None:
+                return checkout_time < self._primary_until
+        return False
+
+    def _get_replica_connection(self):
+        "Return a connection to an available replica or None"
+        for _ in range(len(self._replicas)):
+            self._replica_index = (
+                (self._replica_index + 1) % len(self._replicas))
+            replica = self._replicas[self._replica_index]
+            if not replica.available:
+                continue
+            try:
+                return replica.getconn()
+            except (PoolError, DatabaseOperationalError):
+                logger.info('fail to get a connection from replica "%s"',
+                    replica.name, exc_info=True)
+
     def get_connection(self, autocommit=False, readonly=False):
         if self._connpool is None:
             self.connect()
+        if (readonly and not autocommit and self._replicas
+                and time.time() >= self._primary_until):
+            conn = self._get_replica_connection()
+            if conn is not None:
+                conn.set_isolation_level(ISOLATION_LEVEL_REPEATABLE_READ)
+                cursor = conn.cursor()
+                cursor.execute('SET TRANSACTION READ ONLY')
+                return conn
+        start = time.time()
+        exhausted = False
         for count in range(config.getint('database', 'retry'), -1, -1):
             try:
                 conn = self._connpool.getconn()
@@ -103,9 +381,11 @@ class Database(DatabaseInterface):
             except PoolError:
                 if count and not self._connpool.closed:
                     logger.info('waiting a connection')
+                    exhausted = True
                     time.sleep(1)
                     continue
                 raise
+        self._connpool.record_wait(time.time() - start, exhausted)
         if autocommit:
             conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
         else:
@@ -116,13 +396,29 @@ class Database(DatabaseInterface):
         return conn
 
     def put_connection(self, connection, close=False):
+        for replica in self._replicas:
+            if connection in replica:
+                replica.putconn(connection, close=close)
+                return
         self._connpool.putconn(connection, close=close)
 
+    def stats(self):
+        "Return the usage of the connection pool and of the replica pools"
+        if self._connpool is None:
+            return {}
+        stats = self._connpool.stats()
+        if self._replicas:
+            stats['replicas'] = {r.name: r.stats() for r in self._replicas}
+        return stats
+
     def close(self):
         if self._connpool is None:
             return
         self._connpool.closeall()
         self._connpool = None
+        for replica in self._replicas:
+            replica.closeall()
+        self._replicas = ()
 
     @classmethod
     def create(cls, connection, database_name):
@@ -318,9 +614,34 @@ class Database(DatabaseInterface):
     def has_constraint(self):
         return True
 
+    def has_returning(self):
+        if self._has_returning is None:
+            connection = self.get_connection()
+            try:
+                # RETURNING clause is available since PostgreSQL 8.2
+                self._has_returning = self.get_version(connection) >= (8, 2)
+            finally:
+                self.put_connection(connection)
+        return self._has_returning
+
     def has_multirow_insert(self):
         return True
 
+    def has_array(self):
+        return True
+
+    def has_window_functions(self):
+        return True
+
+    def has_update_from(self):
+        return True
+
+    def has_channel(self):
+        return True
+
+    def has_server_cursor(self):
+        return True
+
     def get_table_schema(self, connection, table_name):
         cursor = connection.cursor()
         for schema in self.search_path:
@@ -398,6 +398,12 @@ class Database(DatabaseInterface):
     def has_multirow_insert(self):
         return True
 
+    def has_window_functions(self):
+        return sqlite.sqlite_version_info >= (3, 25, 0)
+
+    def has_update_from(self):
+        return sqlite.sqlite_version_info >= (3, 33, 0)
+
 sqlite.register_converter('NUMERIC', lambda val: Decimal(val.decode('utf-8')))
 if sys.version_info[0] == 2:
     sqlite.register_adapter(Decimal, lambda val: buffer(str(val)))
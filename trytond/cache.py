@@ -1,14 +1,31 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+import os
+import json
+import time
+import select
+import logging
+import threading
 from threading import Lock
 from collections import OrderedDict
+from multiprocessing.managers import BaseManager
 
 from sql import Table
 from sql.functions import CurrentTimestamp
 
+from trytond import backend
+from trytond.config import config
 from trytond.transaction import Transaction
 
-__all__ = ['Cache', 'LRUDict']
+__all__ = ['BaseCache', 'MemoryCache', 'SharedCache', 'Cache', 'LRUDict']
+logger = logging.getLogger(__name__)
+_select_timeout = 60
+_shared_retry = 60
+_missing = object()
 
 
 def freeze(o):
@@ -20,22 +37,23 @@ def freeze(o):
         return o
 
 
-class Cache(object):
+class BaseCache(object):
     """
-    A key value LRU cache with size limit.
+    A key value cache with size limit invalidated per database.
     """
     _cache_instance = []
     _resets = {}
     _resets_lock = Lock()
+    _channel = 'ir_cache'
+    _listener = {}
+    _listener_lock = Lock()
+    _clean_timestamps = {}
 
     def __init__(self, name, size_limit=1024, context=True):
         self.size_limit = size_limit
         self.context = context
-        self._cache = {}
         self._cache_instance.append(self)
         self._name = name
-        self._timestamp = None
-        self._lock = Lock()
 
     def _key(self, key):
         if self.context:
@@ -43,35 +61,38 @@ class Cache(object):
         return key
 
     def get(self, key, default=None):
-        dbname = Transaction().database.name
-        key = self._key(key)
-        with self._lock:
-            cache = self._cache.setdefault(dbname, LRUDict(self.size_limit))
-            try:
-                result = cache[key] = cache.pop(key)
-                return result
-            except (KeyError, TypeError):
-                return default
+        raise NotImplementedError
 
     def set(self, key, value):
-        dbname = Transaction().database.name
-        key = self._key(key)
-        with self._lock:
-            cache = self._cache.setdefault(dbname, LRUDict(self.size_limit))
-            try:
-                cache[key] = value
-            except TypeError:
-                pass
-        return value
+        raise NotImplementedError
 
     def clear(self):
-        dbname = Transaction().database.name
-        Cache.reset(dbname, self._name)
-        with self._lock:
-            self._cache[dbname] = LRUDict(self.size_limit)
+        database = Transaction().database
+        BaseCache.reset(database.name, self._name)
+        self._clear(database.name)
+        database.use_primary()
+
+    @staticmethod
+    def _stale():
+        "Return True if the values read by the transaction must not be cached"
+        transaction = Transaction()
+        return transaction.database.is_stale(transaction.connection)
+
+    def _clear(self, dbname, timestamp=None):
+        """
+        Clear the cache of the database
+        If timestamp is set, clear only if it is newer than the previous one.
+        """
+        raise NotImplementedError
+
+    def _drop(self, dbname):
+        "Remove the cache of the database"
+        raise NotImplementedError
 
     @staticmethod
     def clean(dbname):
+        if BaseCache._listening(dbname):
+            return
         with Transaction().new_transaction() as transaction,\
                 transaction.connection.cursor() as cursor:
             table = Table('ir_cache')
@@ -79,28 +100,99 @@ class Cache(object):
             timestamps = {}
             for timestamp, name in cursor.fetchall():
                 timestamps[name] = timestamp
-        for inst in Cache._cache_instance:
+        if timestamps:
+            last = max(timestamps.itervalues())
+            previous = BaseCache._clean_timestamps.get(dbname)
+            if previous is not None and last > previous:
+                Transaction().database.use_primary()
+            BaseCache._clean_timestamps[dbname] = last
+        for inst in BaseCache._cache_instance:
             if inst._name in timestamps:
-                with inst._lock:
-                    if (not inst._timestamp
-                            or timestamps[inst._name] > inst._timestamp):
-                        inst._timestamp = timestamps[inst._name]
-                        inst._cache[dbname] = LRUDict(inst.size_limit)
+                inst._clear(dbname, timestamps[inst._name])
+
+    @staticmethod
+    def _listening(dbname):
+        """
+        Return True if the cache is invalidated by a listener on the channel
+        of the database. The listener is started if needed but the caches
+        must still be cleaned once as the previous resets are not notified.
+        """
+        database = Transaction().database
+        if not database.has_channel():
+            return False
+        key = (os.getpid(), dbname)
+        with BaseCache._listener_lock:
+            listener = BaseCache._listener.get(key)
+            if listener:
+                return True
+            ready = threading.Event()
+            listener = threading.Thread(
+                target=BaseCache._listen, args=(dbname, ready))
+            listener.daemon = True
+            BaseCache._listener[key] = listener
+        listener.start()
+        # Wait for the listener to not miss resets between clean and LISTEN
+        ready.wait(_select_timeout)
+        return False
+
+    @staticmethod
+    def _listen(dbname, ready):
+        Database = backend.get('Database')
+        database = Database(dbname)
+        key = (os.getpid(), dbname)
+        current_thread = threading.current_thread()
+        logger.info('listening on channel %s of "%s"',
+            BaseCache._channel, dbname)
+        connection = None
+        try:
+            connection = database.get_connection(autocommit=True)
+            cursor = connection.cursor()
+            cursor.execute('LISTEN "%s"' % BaseCache._channel)
+            ready.set()
+            while BaseCache._listener.get(key) == current_thread:
+                readables, _, _ = select.select(
+                    [connection], [], [], _select_timeout)
+                if not readables:
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    notification = connection.notifies.pop(0)
+                    if not notification.payload:
+                        continue
+                    names = set(json.loads(notification.payload))
+                    database.use_primary()
+                    for inst in BaseCache._cache_instance:
+                        if inst._name in names:
+                            inst._clear(dbname)
+        except Exception:
+            logger.error('cache listener on "%s" crashed', dbname,
+                exc_info=True)
+        finally:
+            ready.set()
+            if connection is not None:
+                try:
+                    database.put_connection(connection, close=True)
+                except Exception:
+                    # The database may have been closed
+                    pass
+            with BaseCache._listener_lock:
+                if BaseCache._listener.get(key) == current_thread:
+                    del BaseCache._listener[key]
 
     @staticmethod
     def reset(dbname, name):
-        with Cache._resets_lock:
-            Cache._resets.setdefault(dbname, set())
-            Cache._resets[dbname].add(name)
+        with BaseCache._resets_lock:
+            BaseCache._resets.setdefault(dbname, set())
+            BaseCache._resets[dbname].add(name)
 
     @staticmethod
     def resets(dbname):
         table = Table('ir_cache')
         with Transaction().new_transaction() as transaction,\
                 transaction.connection.cursor() as cursor,\
-                Cache._resets_lock:
-            Cache._resets.setdefault(dbname, set())
-            for name in Cache._resets[dbname]:
+                BaseCache._resets_lock:
+            resets = BaseCache._resets.setdefault(dbname, set())
+            for name in resets:
                 cursor.execute(*table.select(table.name,
                         where=table.name == name))
                 if cursor.fetchone():
@@ -112,12 +204,271 @@ class Cache(object):
                     cursor.execute(*table.insert(
                             [table.timestamp, table.name],
                             [[CurrentTimestamp(), name]]))
-            Cache._resets[dbname].clear()
+            if resets and transaction.database.has_channel():
+                # The notification is sent when the transaction is committed
+                cursor.execute('NOTIFY "%s", %%s' % BaseCache._channel,
+                    (json.dumps(sorted(resets)),))
+            resets.clear()
 
     @classmethod
     def drop(cls, dbname):
-        for inst in cls._cache_instance:
-            inst._cache.pop(dbname, None)
+        with BaseCache._listener_lock:
+            # The listener stops at its next loop
+            BaseCache._listener.pop((os.getpid(), dbname), None)
+        for inst in BaseCache._cache_instance:
+            inst._drop(dbname)
+
+
+class MemoryCache(BaseCache):
+    """
+    A key value LRU cache with size limit kept in the process memory.
+    """
+
+    def __init__(self, name, size_limit=1024, context=True):
+        super(MemoryCache, self).__init__(name, size_limit=size_limit,
+            context=context)
+        self._cache = {}
+        self._timestamp = None
+        self._lock = Lock()
+
+    def _local_cache(self):
+        return LRUDict(self.size_limit)
+
+    def get(self, key, default=None):
+        dbname = Transaction().database.name
+        key = self._key(key)
+        with self._lock:
+            cache = self._cache.get(dbname)
+            if cache is None:
+                cache = self._cache[dbname] = self._local_cache()
+            try:
+                result = cache[key] = cache.pop(key)
+                return result
+            except (KeyError, TypeError):
+                return default
+
+    def set(self, key, value):
+        if self._stale():
+            return value
+        dbname = Transaction().database.name
+        key = self._key(key)
+        with self._lock:
+            cache = self._cache.get(dbname)
+            if cache is None:
+                cache = self._cache[dbname] = self._local_cache()
+            try:
+                cache[key] = value
+            except TypeError:
+                pass
+        return value
+
+    def _clear(self, dbname, timestamp=None):
+        with self._lock:
+            if timestamp is not None:
+                if self._timestamp and timestamp <= self._timestamp:
+                    return
+                self._timestamp = timestamp
+            self._cache[dbname] = self._local_cache()
+
+    def _drop(self, dbname):
+        with self._lock:
+            self._cache.pop(dbname, None)
+
+
+class _SharedStore(object):
+    "The caches of all the processes kept by the shared cache server"
+
+    def __init__(self, eviction='lru'):
+        assert eviction in ('lru', 'fifo')
+        self._eviction = eviction
+        self._caches = {}
+        self._timestamps = {}
+        self._lock = Lock()
+
+    def get(self, dbname, name, key):
+        "Return a tuple with a boolean if key is found and the value"
+        with self._lock:
+            cache = self._caches.get((dbname, name))
+            if cache is None or key not in cache:
+                return False, None
+            if self._eviction == 'lru':
+                cache[key] = value = cache.pop(key)
+            else:
+                value = cache[key]
+            return True, value
+
+    def set(self, dbname, name, key, value, size_limit):
+        with self._lock:
+            cache = self._caches.get((dbname, name))
+            if cache is None:
+                cache = self._caches[dbname, name] = LRUDict(size_limit)
+            cache[key] = value
+
+    def clear(self, dbname, name, timestamp=None):
+        with self._lock:
+            if timestamp is not None:
+                previous = self._timestamps.get((dbname, name))
+                if previous and timestamp <= previous:
+                    return
+                self._timestamps[dbname, name] = timestamp
+            self._caches.pop((dbname, name), None)
+
+    def drop(self, dbname):
+        with self._lock:
+            for key in self._caches.keys():
+                if key[0] == dbname:
+                    del self._caches[key]
+            for key in self._timestamps.keys():
+                if key[0] == dbname:
+                    del self._timestamps[key]
+
+
+class _SharedManager(BaseManager):
+    pass
+
+
+_SharedManager.register('get_store')
+
+
+def _shared_address():
+    return config.get('cache', 'socket',
+        default=os.path.join(config.get('database', 'path'), 'cache.sock'))
+
+
+def _shared_authkey():
+    authkey = config.get('cache', 'authkey')
+    if not authkey:
+        # The server unpickles what its clients send
+        raise ValueError('Missing authkey in cache section')
+    return authkey
+
+
+class SharedCache(MemoryCache):
+    """
+    A key value LRU cache with size limit shared by all the processes of the
+    host through the local socket of a trytond-cache server.
+    The keys are namespaced by database and cache name.
+    The last local_size_limit values used are also kept in the process memory
+    so the server is not queried for the most frequent keys.
+    """
+    local_size_limit = 64
+    _stores = {}
+    _stores_lock = Lock()
+    _retries = {}
+    _unpicklable = set()
+
+    @classmethod
+    def _store(cls):
+        pid = os.getpid()
+        store = cls._stores.get(pid)
+        if store is None:
+            with cls._stores_lock:
+                store = cls._stores.get(pid)
+                if store is None:
+                    if time.time() < cls._retries.get(pid, 0):
+                        raise IOError('shared cache unavailable')
+                    manager = _SharedManager(address=_shared_address(),
+                        authkey=_shared_authkey())
+                    try:
+                        manager.connect()
+                    except (IOError, EOFError):
+                        cls._unavailable(pid)
+                        raise
+                    store = cls._stores[pid] = manager.get_store()
+                    cls._retries.pop(pid, None)
+        return store
+
+    def _local_cache(self):
+        return LRUDict(min(self.size_limit, self.local_size_limit))
+
+    @classmethod
+    def _unavailable(cls, pid):
+        "Wait before connecting again to the server"
+        logger.warning('shared cache unavailable, retry in %ss',
+            _shared_retry, exc_info=True)
+        cls._stores.pop(pid, None)
+        cls._retries[pid] = time.time() + _shared_retry
+
+    @classmethod
+    def _call(cls, method, *args):
+        store = cls._store()
+        try:
+            return getattr(store, method)(*args)
+        except (IOError, EOFError):
+            with cls._stores_lock:
+                if cls._stores.get(os.getpid()) is store:
+                    cls._unavailable(os.getpid())
+            raise
+
+    def get(self, key, default=None):
+        result = super(SharedCache, self).get(key, _missing)
+        if result is not _missing:
+            return result
+        dbname = Transaction().database.name
+        try:
+            found, result = self._call('get', dbname, self._name,
+                self._key(key))
+        except (IOError, EOFError, TypeError):
+            return default
+        if not found:
+            return default
+        return super(SharedCache, self).set(key, result)
+
+    def set(self, key, value):
+        if self._stale():
+            return value
+        super(SharedCache, self).set(key, value)
+        dbname = Transaction().database.name
+        try:
+            self._call('set', dbname, self._name, self._key(key), value,
+                self.size_limit)
+        except (IOError, EOFError):
+            pass
+        except (pickle.PicklingError, TypeError):
+            # Unpicklable values stay only in the process memory
+            if self._name not in self._unpicklable:
+                self._unpicklable.add(self._name)
+                logger.warning('unable to share values of cache %s',
+                    self._name, exc_info=True)
+        return value
+
+    def _clear(self, dbname, timestamp=None):
+        super(SharedCache, self)._clear(dbname, timestamp=timestamp)
+        try:
+            self._call('clear', dbname, self._name, timestamp)
+        except (IOError, EOFError):
+            pass
+
+    def _drop(self, dbname):
+        super(SharedCache, self)._drop(dbname)
+        try:
+            self._call('drop', dbname)
+        except (IOError, EOFError):
+            pass
+
+    @staticmethod
+    def serve():
+        "Run the server of the shared caches"
+        store = _SharedStore(
+            eviction=config.get('cache', 'eviction', default='lru'))
+
+        class Manager(_SharedManager):
+            pass
+        Manager.register('get_store', callable=lambda: store)
+
+        address = _shared_address()
+        authkey = _shared_authkey()
+        if os.path.exists(address):
+            os.remove(address)
+        manager = Manager(address=address, authkey=authkey)
+        # Only the user of the server can connect to the socket
+        umask = os.umask(0o177)
+        try:
+            server = manager.get_server()
+        finally:
+            os.umask(umask)
+        logger.info('serving shared cache on %s', address)
+        server.serve_forever()
 
 
 class LRUDict(OrderedDict):
@@ -170,3 +521,14 @@ class LRUDictTransaction(LRUDict):
     def refresh(self):
         if self.counter != self.transaction.counter:
             self.clear()
+
+
+def _resolve(name):
+    module_name, class_name = name.rsplit('.', 1)
+    module = __import__(module_name, fromlist=[class_name])
+    return getattr(module, class_name)
+
+if config.get('cache', 'class'):
+    Cache = _resolve(config.get('cache', 'class'))
+else:
+    Cache = MemoryCache
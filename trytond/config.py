@@ -44,6 +44,7 @@ class TrytonConfigParser(ConfigParser.RawConfigParser):
         self.add_section('web')
         self.set('web', 'listen', 'localhost:8000')
         self.set('web', 'root', '/var/www/localhost/tryton')
+        self.set('web', 'workers', 0)
         self.add_section('database')
         self.set('database', 'uri',
             os.environ.get('TRYTOND_DATABASE_URI', 'sqlite://'))
@@ -55,11 +56,13 @@ class TrytonConfigParser(ConfigParser.RawConfigParser):
         self.set('cache', 'model', 200)
         self.set('cache', 'record', 2000)
         self.set('cache', 'field', 100)
+        self.set('cache', 'query', 100)
         self.add_section('ssl')
         self.add_section('email')
         self.set('email', 'uri', 'smtp://localhost:25')
         self.add_section('session')
         self.set('session', 'timeout', 600)
+        self.set('session', 'refresh', 60)
         self.add_section('report')
         self.set('report', 'unoconv',
             'pipe,name=trytond;urp;StarOffice.ComponentContext')
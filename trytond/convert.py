@@ -5,11 +5,13 @@ from xml import sax
 import logging
 import re
 from itertools import izip
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from decimal import Decimal
 
 from . import __version__
-from .tools import grouped_slice
+from sql import Literal
+
+from .tools import grouped_slice, reduce_ids
 from .transaction import Transaction
 from .pyson import PYSONEncoder, CONTEXT
 
@@ -43,11 +45,10 @@ class MenuitemTagHandler:
         self.xml_id = None
 
     def startElement(self, name, attributes):
-        cursor = Transaction().connection.cursor()
-
         values = {}
 
         self.xml_id = attributes['id']
+        self.action = None
 
         for attr in ('name', 'icon', 'sequence', 'parent', 'action', 'groups'):
             if attributes.get(attr):
@@ -59,85 +60,17 @@ class MenuitemTagHandler:
         if values.get('parent'):
             values['parent'] = self.mh.get_id(values['parent'])
 
-        action_name = None
         if values.get('action'):
-            action_id = self.mh.get_id(values['action'])
-
-            # TODO maybe use a prefetch for this:
-            action = self.mh.pool.get('ir.action').__table__()
-            report = self.mh.pool.get('ir.action.report').__table__()
-            act_window = self.mh.pool.get('ir.action.act_window').__table__()
-            wizard = self.mh.pool.get('ir.action.wizard').__table__()
-            url = self.mh.pool.get('ir.action.url').__table__()
-            act_window_view = self.mh.pool.get(
-                'ir.action.act_window.view').__table__()
-            view = self.mh.pool.get('ir.ui.view').__table__()
-            icon = self.mh.pool.get('ir.ui.icon').__table__()
-            cursor.execute(*action.join(
-                    report, 'LEFT',
-                    condition=action.id == report.action
-                    ).join(act_window, 'LEFT',
-                    condition=action.id == act_window.action
-                    ).join(wizard, 'LEFT',
-                    condition=action.id == wizard.action
-                    ).join(url, 'LEFT',
-                    condition=action.id == url.action
-                    ).join(act_window_view, 'LEFT',
-                    condition=act_window.id == act_window_view.act_window
-                    ).join(view, 'LEFT',
-                    condition=view.id == act_window_view.view
-                    ).join(icon, 'LEFT',
-                    condition=action.icon == icon.id).select(
-                    action.name.as_('action_name'),
-                    action.type.as_('action_type'),
-                    view.type.as_('view_type'),
-                    view.field_childs.as_('field_childs'),
-                    icon.name.as_('icon_name'),
-                    where=(report.id == action_id)
-                    | (act_window.id == action_id)
-                    | (wizard.id == action_id)
-                    | (url.id == action_id),
-                    order_by=act_window_view.sequence, limit=1))
-            action_name, action_type, view_type, field_childs, icon_name = \
-                cursor.fetchone()
-
-            values['action'] = '%s,%s' % (action_type, action_id)
-
-            icon = attributes.get('icon', '')
-            if icon:
-                values['icon'] = icon
-            elif icon_name:
-                values['icon'] = icon_name
-            elif action_type == 'ir.action.wizard':
-                values['icon'] = 'tryton-executable'
-            elif action_type == 'ir.action.report':
-                values['icon'] = 'tryton-print'
-            elif action_type == 'ir.action.act_window':
-                if view_type == 'tree':
-                    if field_childs:
-                        values['icon'] = 'tryton-tree'
-                    else:
-                        values['icon'] = 'tryton-list'
-                elif view_type == 'form':
-                    values['icon'] = 'tryton-new'
-                elif view_type == 'graph':
-                    values['icon'] = 'tryton-graph'
-                elif view_type == 'calendar':
-                    values['icon'] = 'tryton-calendar'
-            elif action_type == 'ir.action.url':
-                values['icon'] = 'tryton-web-browser'
-            else:
-                values['icon'] = 'tryton-new'
+            self.action = (self.mh.get_model(values['action']),
+                self.mh.get_id(values['action']))
+            del values['action']
 
         if values.get('groups'):
             raise Exception("Please use separate records for groups")
 
-        if not values.get('name'):
-            if not action_name:
-                raise Exception("Please provide at least a 'name' attributes "
-                        "or a 'action' attributes on the menuitem tags.")
-            else:
-                values['name'] = action_name
+        if not values.get('name') and not self.action:
+            raise Exception("Please provide at least a 'name' attributes "
+                    "or a 'action' attributes on the menuitem tags.")
 
         if values.get('sequence'):
             values['sequence'] = int(values['sequence'])
@@ -152,7 +85,7 @@ class MenuitemTagHandler:
         if name != "menuitem":
             return self
         else:
-            self.mh.import_record('ir.ui.menu', self.values, self.xml_id)
+            self.mh.import_menuitem(self.values, self.xml_id, self.action)
             return None
 
     def current_state(self):
@@ -215,6 +148,7 @@ class RecordTagHandler:
             pyson_attr = bool(int(attributes.get('pyson', '0')))
 
             if search_attr:
+                self.mh.flush()
                 search_model = self.model._fields[field_name].model_name
                 SearchModel = self.mh.pool.get(search_model)
                 with Transaction().set_context(active_test=False):
@@ -364,18 +298,21 @@ class Fs2bdAccessor:
 
     def fetch_new_module(self, module):
         self.fs2db[module] = {}
-        module_data_ids = self.ModelData.search([
-                ('module', '=', module),
-                ], order=[('db_id', 'ASC')])
+        model_data = self.ModelData.__table__()
+        cursor = Transaction().connection.cursor()
+        cursor.execute(*model_data.select(model_data.id, model_data.fs_id,
+                model_data.db_id, model_data.model, model_data.values,
+                where=model_data.module == module,
+                order_by=model_data.db_id.asc))
 
         record_ids = {}
-        for rec in self.ModelData.browse(module_data_ids):
-            self.fs2db[rec.module][rec.fs_id] = {
-                "db_id": rec.db_id, "model": rec.model,
-                "id": rec.id, "values": rec.values
+        for id_, fs_id, db_id, model, values in cursor.fetchall():
+            self.fs2db[module][fs_id] = {
+                "db_id": db_id, "model": model,
+                "id": id_, "values": values,
                 }
-            record_ids.setdefault(rec.model, [])
-            record_ids[rec.model].append(rec.db_id)
+            record_ids.setdefault(model, [])
+            record_ids[model].append(db_id)
 
         self.browserecord[module] = {}
         for model_name in record_ids.keys():
@@ -407,12 +344,17 @@ class TrytondXmlHandler(sax.handler.ContentHandler):
         self.ModelData = pool.get('ir.model.data')
         self.fs2db = Fs2bdAccessor(self.ModelData, pool)
         self.to_delete = self.populate_to_delete()
+        self.fs_ids = set()
         self.noupdate = None
         self.module_state = module_state
         self.grouped = None
-        self.grouped_creations = defaultdict(dict)
-        self.grouped_write = defaultdict(list)
+        self.grouped_creations = OrderedDict()
+        self.grouped_write = OrderedDict()
+        self.grouped_menuitems = []
         self.grouped_model_data = []
+        # The records not yet flushed and their model if not grouped
+        self.pending = set()
+        self.pending_model = None
         self.skip_data = False
         Module = pool.get('ir.module')
         self.installed_modules = [m.name for m in Module.search([
@@ -445,6 +387,7 @@ class TrytondXmlHandler(sax.handler.ContentHandler):
 
         try:
             self.sax_parser.parse(source)
+            self.flush()
         except Exception:
             logger.error(
                 "Error while parsing xml file:\n" + self.current_state(),
@@ -489,14 +432,8 @@ class TrytondXmlHandler(sax.handler.ContentHandler):
 
     def endElement(self, name):
 
-        if name == 'data' and self.grouped:
-            for model, values in self.grouped_creations.iteritems():
-                self.create_records(model, values.values(), values.keys())
-            self.grouped_creations.clear()
-            for key, actions in self.grouped_write.iteritems():
-                module, model = key
-                self.write_records(module, model, *actions)
-            self.grouped_write.clear()
+        if name == 'data':
+            self.flush()
         if name == 'data' and self.grouped_model_data:
             self.ModelData.write(*self.grouped_model_data)
             del self.grouped_model_data[:]
@@ -514,17 +451,144 @@ class TrytondXmlHandler(sax.handler.ContentHandler):
         else:
             return ''
 
-    def get_id(self, xml_id):
-
+    def _get_data(self, xml_id):
         if '.' in xml_id:
             module, xml_id = xml_id.split('.')
         else:
             module = self.module
 
+        if (self.fs2db.get(module, xml_id) is None
+                and (module, xml_id) in self.pending):
+            self.flush()
         if self.fs2db.get(module, xml_id) is None:
             raise Exception("Reference to %s not found"
                 % ".".join([module, xml_id]))
-        return self.fs2db.get(module, xml_id)["db_id"]
+        return self.fs2db.get(module, xml_id)
+
+    def get_id(self, xml_id):
+        return self._get_data(xml_id)["db_id"]
+
+    def get_model(self, xml_id):
+        return self._get_data(xml_id)["model"]
+
+    def flush(self):
+        "Import the pending records in batch"
+        menuitems, self.grouped_menuitems = self.grouped_menuitems, []
+        if menuitems:
+            self.flush_menuitems(menuitems)
+        for model, values in self.grouped_creations.iteritems():
+            self.create_records(model, values.values(), values.keys())
+        self.grouped_creations.clear()
+        for key, actions in self.grouped_write.iteritems():
+            module, model = key
+            self.write_records(module, model, *actions)
+        self.grouped_write.clear()
+        self.pending.clear()
+        self.pending_model = None
+
+    def _add_pending(self, model, module, fs_id):
+        if ((module, fs_id) in self.pending
+                or (not self.grouped and model != self.pending_model)):
+            self.flush()
+        self.pending.add((module, fs_id))
+        self.pending_model = model
+
+    def import_menuitem(self, values, fs_id, action=None):
+        if '.' in fs_id:
+            module, xml_id = fs_id.split('.')
+        else:
+            module, xml_id = self.module, fs_id
+        self._add_pending('ir.ui.menu', module, xml_id)
+        self.grouped_menuitems.append((values, fs_id, action))
+
+    def flush_menuitems(self, menuitems):
+        pool = self.pool
+        cursor = Transaction().connection.cursor()
+        action = pool.get('ir.action').__table__()
+        report = pool.get('ir.action.report').__table__()
+        act_window = pool.get('ir.action.act_window').__table__()
+        wizard = pool.get('ir.action.wizard').__table__()
+        url = pool.get('ir.action.url').__table__()
+        act_window_view = pool.get('ir.action.act_window.view').__table__()
+        view = pool.get('ir.ui.view').__table__()
+        icon = pool.get('ir.ui.icon').__table__()
+        tables = {
+            'ir.action.report': report,
+            'ir.action.act_window': act_window,
+            'ir.action.wizard': wizard,
+            'ir.action.url': url,
+            }
+
+        model2ids = defaultdict(set)
+        for _, _, action_ref in menuitems:
+            if action_ref:
+                model, action_id = action_ref
+                if model not in tables:
+                    raise Exception("Menuitem action must be one of %s"
+                        % ', '.join(sorted(tables)))
+                model2ids[model].add(action_id)
+        actions = {}
+        for model, ids in model2ids.iteritems():
+            table = tables[model]
+            query = table.join(action,
+                condition=table.action == action.id
+                ).join(icon, 'LEFT',
+                condition=action.icon == icon.id)
+            if table is act_window:
+                query = query.join(act_window_view, 'LEFT',
+                    condition=act_window.id == act_window_view.act_window
+                    ).join(view, 'LEFT',
+                    condition=view.id == act_window_view.view)
+                columns = [view.type, view.field_childs]
+                order_by = [act_window_view.sequence]
+            else:
+                columns = [Literal(None), Literal(None)]
+                order_by = []
+            for sub_ids in grouped_slice(ids):
+                cursor.execute(*query.select(
+                        table.id, action.name, action.type, icon.name,
+                        *columns,
+                        where=reduce_ids(table.id, sub_ids),
+                        order_by=order_by))
+                for row in cursor.fetchall():
+                    actions.setdefault((model, row[0]), row[1:])
+
+        for values, fs_id, action_ref in menuitems:
+            if action_ref:
+                action_name, action_type, icon_name, view_type, \
+                    field_childs = actions[action_ref]
+                values['action'] = '%s,%s' % (action_type, action_ref[1])
+                if not values.get('name'):
+                    values['name'] = action_name
+                if not values.get('icon'):
+                    icon_name = icon_name or self._menuitem_icon(
+                        action_type, view_type, field_childs)
+                    if icon_name:
+                        values['icon'] = icon_name
+            self._import_record('ir.ui.menu', values, fs_id)
+
+    @staticmethod
+    def _menuitem_icon(action_type, view_type, field_childs):
+        if action_type == 'ir.action.wizard':
+            return 'tryton-executable'
+        elif action_type == 'ir.action.report':
+            return 'tryton-print'
+        elif action_type == 'ir.action.act_window':
+            if view_type == 'tree':
+                if field_childs:
+                    return 'tryton-tree'
+                else:
+                    return 'tryton-list'
+            elif view_type == 'form':
+                return 'tryton-new'
+            elif view_type == 'graph':
+                return 'tryton-graph'
+            elif view_type == 'calendar':
+                return 'tryton-calendar'
+        elif action_type == 'ir.action.url':
+            return 'tryton-web-browser'
+        else:
+            return 'tryton-new'
 
     @staticmethod
     def _clean_value(key, record):
@@ -562,10 +626,17 @@ class TrytondXmlHandler(sax.handler.ContentHandler):
         return set(rec.fs_id for rec in module_data)
 
     def import_record(self, model, values, fs_id):
-        module = self.module
-
         if not fs_id:
             raise Exception('import_record : Argument fs_id is mandatory')
+        if '.' in fs_id:
+            module, xml_id = fs_id.split('.', 1)
+        else:
+            module, xml_id = self.module, fs_id
+        self._add_pending(model, module, xml_id)
+        self._import_record(model, values, fs_id)
+
+    def _import_record(self, model, values, fs_id):
+        module = self.module
 
         if '.' in fs_id:
             assert len(fs_id.split('.')) == 2, ('"%s" contains too many dots. '
@@ -579,6 +650,7 @@ class TrytondXmlHandler(sax.handler.ContentHandler):
                     % (module, fs_id))
 
         Model = self.pool.get(model)
+        self.fs_ids.add((module, fs_id))
 
         if self.fs2db.get(module, fs_id):
 
@@ -625,12 +697,7 @@ class TrytondXmlHandler(sax.handler.ContentHandler):
                 record = self.fs2db.get_browserecord(
                     module, Model.__name__, record.id)
 
-                data = self.ModelData.search([
-                    ('fs_id', '=', fs_id),
-                    ('module', '=', module),
-                    ('model', '=', Model.__name__),
-                    ], limit=1)
-                self.ModelData.write(data, {
+                self.ModelData.write([self.ModelData(mdata_id)], {
                     'db_id': record.id,
                     })
                 self.fs2db.get(module, fs_id)["db_id"] = record.id
@@ -677,20 +744,14 @@ class TrytondXmlHandler(sax.handler.ContentHandler):
                 # and no user changed the value in the db:
                 to_update[key] = values[key]
 
-            if self.grouped:
-                self.grouped_write[(module, model)].extend(
-                    (record, to_update, old_values, fs_id, mdata_id))
-            else:
-                self.write_records(module, model, record, to_update,
-                    old_values, fs_id, mdata_id)
+            self.grouped_write.setdefault((module, model), []).extend(
+                (record, to_update, old_values, fs_id, mdata_id))
             self.grouped_model_data.extend(([self.ModelData(mdata_id)], {
                         'fs_values': self.ModelData.dump_values(values),
                         }))
         else:
-            if self.grouped:
-                self.grouped_creations[model][fs_id] = values
-            else:
-                self.create_records(model, [values], [fs_id])
+            self.grouped_creations.setdefault(model, OrderedDict())[fs_id] = (
+                values)
 
     def create_records(self, model, vlist, fs_ids):
         Model = self.pool.get(model)
@@ -60,6 +60,7 @@ def register():
         ModelFieldAccess,
         ModelButton,
         ModelData,
+        ModelFingerprint,
         PrintModelGraphStart,
         Attachment,
         Note,
@@ -72,6 +73,7 @@ def register():
         Rule,
         Module,
         ModuleDependency,
+        ModuleFile,
         ModuleConfigWizardItem,
         ModuleConfigWizardFirst,
         ModuleConfigWizardOther,
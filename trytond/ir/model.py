@@ -6,6 +6,7 @@ import heapq
 from sql import Null
 from sql.aggregate import Max
 from sql.conditionals import Case
+from sql.functions import CurrentTimestamp
 from collections import defaultdict
 try:
     import simplejson as json
@@ -30,8 +31,8 @@ except ImportError:
 
 __all__ = [
     'Model', 'ModelField', 'ModelAccess', 'ModelFieldAccess', 'ModelButton',
-    'ModelData', 'PrintModelGraphStart', 'PrintModelGraph', 'ModelGraph',
-    'ModelWorkflowGraph',
+    'ModelData', 'ModelFingerprint', 'PrintModelGraphStart', 'PrintModelGraph',
+    'ModelGraph', 'ModelWorkflowGraph',
     ]
 
 IDENTIFIER = re.compile(r'^[a-zA-z_][a-zA-Z0-9_]*$')
@@ -951,6 +952,70 @@ class ModelData(ModelSQL, ModelView):
             cls.write(*to_write)
 
 
+class ModelFingerprint(ModelSQL):
+    "Model Fingerprint"
+    __name__ = 'ir.model.fingerprint'
+    model = fields.Char('Model', required=True, select=True)
+    module = fields.Char('Module', required=True)
+    fingerprint = fields.Char('Fingerprint', required=True)
+
+    @classmethod
+    def __setup__(cls):
+        super(ModelFingerprint, cls).__setup__()
+        table = cls.__table__()
+        cls._sql_constraints += [
+            ('model_module_uniq', Unique(table, table.model, table.module),
+                'The fingerprint must be unique by model and module!'),
+            ]
+
+    @classmethod
+    def _get_fingerprints(cls):
+        "Return the fingerprints stored by model and module"
+        # All the fingerprints are loaded at once for the transaction
+        TableHandler = backend.get('TableHandler')
+        transaction = Transaction()
+        cache = transaction.get_cache()
+        fingerprints = cache.get('_ir_model_fingerprint')
+        if fingerprints is None:
+            if not TableHandler.table_exist(cls._table):
+                return
+            table = cls.__table__()
+            cursor = transaction.connection.cursor()
+            cursor.execute(*table.select(
+                    table.model, table.module, table.fingerprint))
+            fingerprints = cache['_ir_model_fingerprint'] = {
+                (model, module): fingerprint
+                for model, module, fingerprint in cursor.fetchall()}
+        return fingerprints
+
+    @classmethod
+    def get_fingerprint(cls, model, module):
+        "Return the fingerprint stored for the model and module"
+        fingerprints = cls._get_fingerprints()
+        if fingerprints:
+            return fingerprints.get((model, module))
+
+    @classmethod
+    def set_fingerprint(cls, model, module, fingerprint):
+        "Store the fingerprint for the model and module"
+        table = cls.__table__()
+        cursor = Transaction().connection.cursor()
+        fingerprints = cls._get_fingerprints()
+        if fingerprints is None:
+            return
+        if (model, module) in fingerprints:
+            cursor.execute(*table.update(
+                    [table.write_uid, table.write_date, table.fingerprint],
+                    [0, CurrentTimestamp(), fingerprint],
+                    where=(table.model == model) & (table.module == module)))
+        else:
+            cursor.execute(*table.insert(
+                    [table.create_uid, table.create_date,
+                        table.model, table.module, table.fingerprint],
+                    [[0, CurrentTimestamp(), model, module, fingerprint]]))
+        fingerprints[(model, module)] = fingerprint
+
+
 class PrintModelGraphStart(ModelView):
     'Print Model Graph'
     __name__ = 'ir.model.print_model_graph.start'
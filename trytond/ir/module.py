@@ -4,6 +4,8 @@ from __future__ import division
 
 from functools import wraps
 
+from sql.aggregate import Count
+from sql.conditionals import Coalesce
 from sql.operators import NotIn
 
 from trytond.model import ModelView, ModelSQL, fields, Unique
@@ -15,9 +17,10 @@ from trytond.pool import Pool
 from trytond.transaction import Transaction
 from trytond.pyson import Eval
 from trytond.rpc import RPC
+from trytond.tools import grouped_slice, reduce_ids
 
 __all__ = [
-    'Module', 'ModuleDependency', 'ModuleConfigWizardItem',
+    'Module', 'ModuleDependency', 'ModuleFile', 'ModuleConfigWizardItem',
     'ModuleConfigWizardFirst', 'ModuleConfigWizardOther',
     'ModuleConfigWizardDone', 'ModuleConfigWizard',
     'ModuleInstallUpgradeStart', 'ModuleInstallUpgradeDone',
@@ -363,6 +366,154 @@ class ModuleDependency(ModelSQL, ModelView):
             return 'unknown'
 
 
+class ModuleFile(ModelSQL):
+    "Module File"
+    __name__ = 'ir.module.file'
+    module = fields.Char('Module', required=True, select=True)
+    name = fields.Char('Name', required=True)
+    digest = fields.Char('Digest', required=True)
+    fs_ids = fields.Text('Identifiers on File System')
+
+    @classmethod
+    def __setup__(cls):
+        super(ModuleFile, cls).__setup__()
+        table = cls.__table__()
+        cls._sql_constraints += [
+            ('module_name_uniq', Unique(table, table.module, table.name),
+                'The file must be unique by module!'),
+            ]
+
+    @classmethod
+    def _get(cls, module, name, digest):
+        records = cls.search([
+                ('module', '=', module),
+                ('name', '=', name),
+                ])
+        if records and records[0].digest == digest:
+            return records[0]
+
+    @classmethod
+    def _loaded_at(cls, record):
+        "Return a sub-query of the time the file was loaded"
+        table = cls.__table__()
+        return table.select(Coalesce(table.write_date, table.create_date),
+            where=table.id == record.id)
+
+    @classmethod
+    def get_xml(cls, module, name, digest):
+        """
+        Return the list of (module, fs_id) loaded by the XML file if its
+        digest is unchanged and none of its records has been modified since
+        or None.
+        """
+        pool = Pool()
+        ModelData = pool.get('ir.model.data')
+        model_data = ModelData.__table__()
+        cursor = Transaction().connection.cursor()
+
+        record = cls._get(module, name, digest)
+        if not record:
+            return
+        fs_ids = [tuple(l.split('.', 1))
+            for l in (record.fs_ids or '').splitlines()]
+
+        module2fs_ids = {}
+        for data_module, fs_id in fs_ids:
+            module2fs_ids.setdefault(data_module, []).append(fs_id)
+        model2ids = {}
+        for data_module, data_fs_ids in module2fs_ids.iteritems():
+            for sub_fs_ids in grouped_slice(data_fs_ids):
+                sub_fs_ids = list(sub_fs_ids)
+                cursor.execute(*model_data.select(
+                        model_data.model, model_data.db_id,
+                        where=(model_data.module == data_module)
+                        & model_data.fs_id.in_(sub_fs_ids)))
+                rows = cursor.fetchall()
+                if len(rows) != len(set(sub_fs_ids)):
+                    return
+                for model, db_id in rows:
+                    model2ids.setdefault(model, set()).add(db_id)
+
+        for model, ids in model2ids.iteritems():
+            try:
+                Model = pool.get(model)
+            except KeyError:
+                return
+            if not issubclass(Model, ModelSQL) or Model.table_query():
+                return
+            table = Model.__table__()
+            for sub_ids in grouped_slice(ids):
+                sub_ids = list(sub_ids)
+                cursor.execute(*table.select(Count(table.id),
+                        where=reduce_ids(table.id, sub_ids)
+                        & (Coalesce(table.write_date, table.create_date)
+                            <= cls._loaded_at(record))))
+                count, = cursor.fetchone()
+                if count != len(sub_ids):
+                    return
+        return fs_ids
+
+    @classmethod
+    def is_po_unchanged(cls, module, name, digest, lang):
+        """
+        Return True if the digest of the PO file is unchanged and no
+        translation of the module has been modified since.
+        """
+        pool = Pool()
+        Translation = pool.get('ir.translation')
+        ModelData = pool.get('ir.model.data')
+        translation = Translation.__table__()
+        model_data = ModelData.__table__()
+        cursor = Transaction().connection.cursor()
+
+        record = cls._get(module, name, digest)
+        if not record:
+            return False
+        loaded_at = cls._loaded_at(record)
+        cursor.execute(*translation.select(translation.id,
+                where=(translation.module == module)
+                & (translation.lang == lang)
+                & (Coalesce(translation.write_date, translation.create_date)
+                    > loaded_at),
+                limit=1))
+        if cursor.fetchone():
+            return False
+        # New records may need translations from the file
+        cursor.execute(*model_data.select(model_data.id,
+                where=(model_data.module == module)
+                & (model_data.create_date > loaded_at),
+                limit=1))
+        return not cursor.fetchone()
+
+    @classmethod
+    def set_file(cls, module, name, digest, fs_ids=None):
+        "Store the digest of the file loaded"
+        values = {
+            'digest': digest,
+            'fs_ids': '\n'.join('.'.join(i) for i in sorted(fs_ids or [])),
+            }
+        records = cls.search([
+                ('module', '=', module),
+                ('name', '=', name),
+                ])
+        if records:
+            cls.write(records, values)
+        else:
+            values.update({
+                    'module': module,
+                    'name': name,
+                    })
+            cls.create([values])
+
+    @classmethod
+    def clean(cls, module, names=None):
+        "Remove the files of module which are not in names"
+        domain = [('module', '=', module)]
+        if names is not None:
+            domain.append(('name', 'not in', names))
+        cls.delete(cls.search(domain))
+
+
 class ModuleConfigWizardItem(ModelSQL, ModelView):
     "Config wizard to run after installing module"
     __name__ = 'ir.module.config_wizard.item'
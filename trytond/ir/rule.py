@@ -1,11 +1,14 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
 from ..model import ModelView, ModelSQL, fields, EvalEnvironment, Check
+from ..model.modelsql import convert_from
 from ..transaction import Transaction
-from ..cache import Cache
+from ..model.modelstorage import cache_size
+from ..model.fields.field import FieldTranslate, SQL_OPERATORS
+from ..cache import Cache, LRUDict, freeze
 from ..pool import Pool
 from .. import backend
-from ..pyson import PYSONDecoder
+from ..pyson import evaluator
 
 __all__ = [
     'RuleGroup', 'Rule',
@@ -131,7 +134,7 @@ class Rule(ModelSQL, ModelView):
         ctx = cls._get_context()
         for rule in rules:
             try:
-                value = PYSONDecoder(ctx).decode(rule.domain)
+                value = evaluator(rule.domain)(ctx)
             except Exception:
                 cls.raise_user_error('invalid_domain', (rule.rec_name,))
             if not isinstance(value, list):
@@ -222,7 +225,7 @@ class Rule(ModelSQL, ModelView):
             for rule in cls.browse(ids):
                 assert rule.domain, ('Rule domain empty,'
                     'check if migration was done')
-                dom = PYSONDecoder(ctx).decode(rule.domain)
+                dom = evaluator(rule.domain)(ctx)
                 if rule.rule_group.global_p:
                     clause_global.setdefault(rule.rule_group.id, ['OR'])
                     clause_global[rule.rule_group.id].append(dom)
@@ -268,13 +271,54 @@ class Rule(ModelSQL, ModelView):
     def query_get(cls, model_name, mode='read'):
         pool = Pool()
         Model = pool.get(model_name)
+        transaction = Transaction()
 
         domain = cls.domain_get(model_name, mode=mode)
 
+        # Only the query of plain column comparisons is kept because the
+        # conversion of other clauses may read records
+        cache = None
+        if cls._domain_plain(Model, domain):
+            transaction_cache = transaction.get_cache()
+            cache = transaction_cache.setdefault('_ir_rule.query_get',
+                LRUDict(cache_size()))
+            key = (model_name, mode, freeze(domain))
+            query = cache.get(key)
+            if query is not None:
+                return query
+
         # Use root to prevent infinite recursion
-        with Transaction().set_user(0), \
-                Transaction().set_context(active_test=False, user=0):
-            return Model.search(domain, order=[], query=True)
+        with transaction.set_user(0), \
+                transaction.set_context(active_test=False, user=0):
+            tables, expression = Model.search_domain(
+                domain, active_test=False)
+        table, _ = tables[None]
+        query = convert_from(None, tables).select(table.id, where=expression)
+        if cache is not None:
+            cache[key] = query
+        return query
+
+    @classmethod
+    def _domain_plain(cls, Model, domain):
+        "Test if the domain contains only plain column comparisons"
+        if not domain:
+            return True
+        if isinstance(domain[0], basestring) and domain[0] in ('AND', 'OR'):
+            return cls._domain_plain(Model, domain[1:])
+        if isinstance(domain, tuple) or isinstance(domain[0], basestring):
+            if len(domain) != 3 or domain[1] not in SQL_OPERATORS:
+                return False
+            name = domain[0]
+            field = Model._fields.get(name)
+            if (field is None
+                    or getattr(Model, 'domain_%s' % name, None)
+                    or isinstance(field, fields.Function)):
+                return False
+            convert_domain = type(field).convert_domain.im_func
+            return convert_domain in (
+                fields.Field.convert_domain.im_func,
+                FieldTranslate.convert_domain.im_func)
+        return all(cls._domain_plain(Model, d) for d in domain)
 
     @classmethod
     def delete(cls, rules):
@@ -9,6 +9,7 @@ import datetime
 
 from trytond.model import ModelSQL, fields
 from trytond.config import config
+from ..cache import Cache
 from .. import backend
 
 __all__ = [
@@ -22,6 +23,7 @@ class Session(ModelSQL):
     _rec_name = 'key'
 
     key = fields.Char('Key', required=True, select=True)
+    _check_cache = Cache('ir_session.check', context=False)
 
     @classmethod
     def __setup__(cls):
@@ -46,26 +48,60 @@ class Session(ModelSQL):
         now = datetime.datetime.now()
         timeout = datetime.timedelta(
             seconds=config.getint('session', 'timeout'))
+        cached = cls._check_cache.get(key)
+        if cached:
+            cached_user, timestamp = cached
+            if cached_user == user and abs(timestamp - now) < timeout:
+                return True
         sessions = cls.search([
                 ('create_uid', '=', user),
                 ])
         find = False
+        to_delete = []
         for session in sessions:
             timestamp = session.write_date or session.create_date
             if abs(timestamp - now) < timeout:
                 if session.key == key:
                     find = True
+                    cls._check_cache.set(key, (user, timestamp))
             else:
-                cls.delete([session])
+                to_delete.append(session)
+        if to_delete:
+            cls._delete_expired(to_delete)
         return find
 
+    @classmethod
+    def _delete_expired(cls, sessions):
+        "Delete expired sessions which are already refused by the cache"
+        keys = [s.key for s in sessions]
+        super(Session, cls).delete(sessions)
+        for key in keys:
+            cls._check_cache.set(key, None)
+
     @classmethod
     def reset(cls, session):
         "Reset session timestamp"
+        now = datetime.datetime.now()
+        refresh = datetime.timedelta(
+            seconds=config.getint('session', 'refresh'))
+        cached = cls._check_cache.get(session)
+        if cached:
+            user, timestamp = cached
+            # Coalesce the refreshes of the session timestamp
+            if abs(timestamp - now) < refresh:
+                return
         sessions = cls.search([
                 ('key', '=', session),
                 ])
         cls.write(sessions, {})
+        for record in sessions:
+            cls._check_cache.set(record.key, (record.create_uid.id, now))
+
+    @classmethod
+    def delete(cls, sessions):
+        super(Session, cls).delete(sessions)
+        # The cache is cleared in all processes
+        cls._check_cache.clear()
 
 
 class SessionWizard(ModelSQL):
@@ -8,12 +8,13 @@ import os
 from hashlib import md5
 from lxml import etree
 from itertools import izip
+from collections import defaultdict
 from io import BytesIO
 
 from sql import Column, Null
-from sql.functions import Substring, Position
+from sql.functions import Substring, Position, CurrentTimestamp
 from sql.conditionals import Case
-from sql.operators import Or, And
+from sql.operators import And
 from sql.aggregate import Max
 
 from genshi.filters.i18n import extract as genshi_extract
@@ -27,7 +28,7 @@ from .. import backend
 from ..pyson import PYSONEncoder, Eval
 from ..transaction import Transaction
 from ..pool import Pool
-from ..cache import Cache
+from ..cache import Cache, MemoryCache
 from ..config import config
 
 __all__ = ['Translation',
@@ -75,6 +76,8 @@ class Translation(ModelSQL, ModelView):
     overriding_module = fields.Char('Overriding Module', readonly=True)
     _translation_cache = Cache('ir.translation', size_limit=10240,
         context=False)
+    # The catalogs are too big to be shared between processes
+    _catalog_cache = MemoryCache('ir.translation.catalog', context=False)
     _get_language_cache = Cache('ir.translation')
 
     @classmethod
@@ -146,6 +149,7 @@ class Translation(ModelSQL, ModelView):
     def register_model(cls, model, module_name):
         cursor = Transaction().connection.cursor()
         ir_translation = cls.__table__()
+        cls._catalog_cache.clear()
 
         if not model.__doc__:
             return
@@ -185,6 +189,7 @@ class Translation(ModelSQL, ModelView):
     def register_fields(cls, model, module_name):
         cursor = Transaction().connection.cursor()
         ir_translation = cls.__table__()
+        cls._catalog_cache.clear()
 
         # Prefetch field translations
         trans_fields = {}
@@ -272,6 +277,7 @@ class Translation(ModelSQL, ModelView):
     def register_error_messages(cls, model, module_name):
         cursor = Transaction().connection.cursor()
         ir_translation = cls.__table__()
+        cls._catalog_cache.clear()
 
         cursor.execute(*ir_translation.select(
                 ir_translation.id, ir_translation.src,
@@ -297,6 +303,7 @@ class Translation(ModelSQL, ModelView):
     def register_wizard(cls, wizard, module_name):
         cursor = Transaction().connection.cursor()
         ir_translation = cls.__table__()
+        cls._catalog_cache.clear()
 
         # Prefetch button translations
         cursor.execute(*ir_translation.select(
@@ -519,24 +526,27 @@ class Translation(ModelSQL, ModelView):
                 translations[translation.name] = translation
 
             to_create = []
+            to_write, write_values = [], []
             for record, value in izip(records, values):
                 translation = translations.get(get_name(record))
+                src = getattr(record, field_name)
                 if not translation:
                     to_create.append({
                             'name': name,
                             'lang': lang,
                             'type': ttype,
-                            'src': getattr(record, field_name),
+                            'src': src,
                             'value': value,
                             'fuzzy': False,
                             })
                 else:
-                    with Transaction().set_context(_check_access=False):
-                        cls.write([translation], {
-                            'src': getattr(record, field_name),
+                    to_write.append(translation)
+                    write_values.append({
+                            'src': src,
                             'value': value,
                             'fuzzy': False,
                             })
+            cls._update(to_write, write_values)
             if to_create:
                 with Transaction().set_context(_check_access=False):
                     cls.create(to_create)
@@ -546,30 +556,29 @@ class Translation(ModelSQL, ModelView):
         with Transaction().set_context(language=Config.get_language()):
             records = Model.browse(ids)
 
+        fuzzy = (lang == Config.get_language()
+            and Transaction().context.get('fuzzy_translation', True))
+        domain = [
+            ('type', '=', ttype),
+            ('name', '=', name),
+            ('res_id', 'in', ids),
+            ]
+        if not fuzzy:
+            domain.append(('lang', '=', lang))
         translations = {}
-        for translation in cls.search([
-                    ('lang', '=', lang),
-                    ('type', '=', ttype),
-                    ('name', '=', name),
-                    ('res_id', 'in', ids),
-                    ]):
-            translations[translation.res_id] = translation
-
-        other_translations = {}
-        if (lang == Config.get_language()
-                and Transaction().context.get('fuzzy_translation', True)):
-            for translation in cls.search([
-                        ('lang', '!=', lang),
-                        ('type', '=', ttype),
-                        ('name', '=', name),
-                        ('res_id', 'in', ids),
-                        ]):
-                other_translations.setdefault(translation.res_id, []
-                    ).append(translation)
+        other_translations = defaultdict(list)
+        for translation in cls.search(domain):
+            if translation.lang == lang:
+                translations[translation.res_id] = translation
+            else:
+                other_translations[translation.res_id].append(translation)
 
         to_create = []
+        to_write, write_values = [], []
+        to_fuzzy, fuzzy_values = [], []
         for record, value in izip(records, values):
             translation = translations.get(record.id)
+            src = getattr(record, field_name)
             if not translation:
                 to_create.append({
                         'name': name,
@@ -577,26 +586,72 @@ class Translation(ModelSQL, ModelView):
                         'type': ttype,
                         'res_id': record.id,
                         'value': value,
-                        'src': getattr(record, field_name),
+                        'src': src,
                         'fuzzy': False,
                         })
             else:
-                with Transaction().set_context(_check_access=False):
-                    cls.write([translation], {
+                to_write.append(translation)
+                write_values.append({
                         'value': value,
-                        'src': getattr(record, field_name),
+                        'src': src,
                         'fuzzy': False,
                         })
-                    other_langs = other_translations.get(record.id)
-                    if other_langs:
-                        cls.write(other_langs, {
-                                'src': getattr(record, field_name),
-                                'fuzzy': True,
-                                })
+                for other in other_translations[record.id]:
+                    to_fuzzy.append(other)
+                    fuzzy_values.append({
+                            'src': src,
+                            'fuzzy': True,
+                            })
+        cls._update(to_write, write_values)
+        cls._update(to_fuzzy, fuzzy_values)
         if to_create:
             with Transaction().set_context(_check_access=False):
                 cls.create(to_create)
 
+    @classmethod
+    def _update(cls, translations, values):
+        '''
+        Update each translation with the values of the same index using a
+        single UPDATE per slice. The values must have the same keys.
+        '''
+        if not translations:
+            return
+        transaction = Transaction()
+        cursor = transaction.connection.cursor()
+        table = cls.__table__()
+
+        cls._translation_cache.clear()
+        cls._catalog_cache.clear()
+        ModelView._fields_view_get_cache.clear()
+        transaction.counter += 1
+        for cache in transaction.cache.itervalues():
+            if cls.__name__ in cache:
+                for translation in translations:
+                    cache[cls.__name__].pop(translation.id, None)
+
+        values = list(values)
+        if 'src' in values[0]:
+            for value in values:
+                value['src_md5'] = cls.get_src_md5(value['src'])
+        fnames = sorted(values[0])
+        # Each value and id is a parameter of the CASE
+        size = max(transaction.database.IN_MAX // len(fnames), 1)
+        for sub_translations in grouped_slice(
+                zip(translations, values), size):
+            sub_translations = list(sub_translations)
+            columns = [table.write_uid, table.write_date]
+            update_values = [transaction.user, CurrentTimestamp()]
+            for fname in fnames:
+                field = cls._fields[fname]
+                column = Column(table, fname)
+                columns.append(column)
+                update_values.append(Case(*((table.id == t.id,
+                                field.sql_format(v[fname]))
+                            for t, v in sub_translations), else_=column))
+            cursor.execute(*table.update(columns, update_values,
+                    where=reduce_ids(table.id,
+                        [t.id for t, _ in sub_translations])))
+
     @classmethod
     def delete_ids(cls, model, ttype, ids):
         "Delete translation for each id"
@@ -610,101 +665,65 @@ class Translation(ModelSQL, ModelView):
         with Transaction().set_context(_check_access=False):
             cls.delete(translations)
 
+    @classmethod
+    def get_catalog(cls, lang):
+        """
+        Return a dictionary with the translation of all the sources of the
+        language per (type, name, source) and also per (type, name, None)
+        """
+        lang = unicode(lang)
+        catalog = cls._catalog_cache.get(lang)
+        if catalog is not None:
+            return catalog
+
+        cursor = Transaction().connection.cursor()
+        table = cls.__table__()
+        cursor.execute(*table.select(
+                table.type, table.name, table.src, table.value,
+                where=(table.lang == lang)
+                & (table.value != '')
+                & (table.value != Null)
+                & (table.fuzzy == False)
+                & (table.res_id == -1)))
+        catalog = {}
+        for ttype, name, source, value in cursor.fetchall():
+            catalog[(ttype, name, source)] = value
+            catalog.setdefault((ttype, name, None), value)
+        cls._catalog_cache.set(lang, catalog)
+        return catalog
+
     @classmethod
     def get_source(cls, name, ttype, lang, source=None):
         "Return translation for source"
         name = unicode(name)
         ttype = unicode(ttype)
-        lang = unicode(lang)
         if source is not None:
             source = unicode(source)
-        trans = cls._translation_cache.get((lang, ttype, name, source), -1)
-        if trans != -1:
-            return trans
-
-        cursor = Transaction().connection.cursor()
-        table = cls.__table__()
-        where = ((table.lang == lang)
-            & (table.type == ttype)
-            & (table.name == name)
-            & (table.value != '')
-            & (table.value != Null)
-            & (table.fuzzy == False)
-            & (table.res_id == -1))
-        if source is not None:
-            where &= table.src == source
-        cursor.execute(*table.select(table.value, where=where))
-        res = cursor.fetchone()
-        if res:
-            cls._translation_cache.set((lang, ttype, name, source), res[0])
-            return res[0]
-        else:
-            cls._translation_cache.set((lang, ttype, name, source), False)
-            return None
+        return cls.get_catalog(lang).get((ttype, name, source))
 
     @classmethod
     def get_sources(cls, args):
         '''
         Take a list of (name, ttype, lang, source).
-        Add the translations to the cache.
         Return a dict with the translations.
         '''
         res = {}
-        clause = []
-        transaction = Transaction()
-        cursor = transaction.connection.cursor()
-        table = cls.__table__()
-        if len(args) > transaction.database.IN_MAX:
-            for sub_args in grouped_slice(args):
-                res.update(cls.get_sources(list(sub_args)))
-            return res
         for name, ttype, lang, source in args:
-            name = unicode(name)
-            ttype = unicode(ttype)
-            lang = unicode(lang)
-            if source is not None:
-                source = unicode(source)
-            trans = cls._translation_cache.get((lang, ttype, name, source), -1)
-            if trans != -1:
-                res[(name, ttype, lang, source)] = trans
-            else:
-                res[(name, ttype, lang, source)] = None
-                cls._translation_cache.set((lang, ttype, name, source), None)
-                where = And(((table.lang == lang),
-                        (table.type == ttype),
-                        (table.name == name),
-                        (table.value != ''),
-                        (table.value != Null),
-                        (table.fuzzy == False),
-                        (table.res_id == -1),
-                        ))
-                if source is not None:
-                    where &= table.src == source
-                clause.append(where)
-        if clause:
-            in_max = transaction.database.IN_MAX // 7
-            for sub_clause in grouped_slice(clause, in_max):
-                cursor.execute(*table.select(
-                        table.lang, table.type, table.name, table.src,
-                        table.value,
-                        where=Or(list(sub_clause))))
-                for lang, ttype, name, source, value in cursor.fetchall():
-                    if (name, ttype, lang, source) not in args:
-                        source = None
-                    res[(name, ttype, lang, source)] = value
-                    cls._translation_cache.set((lang, ttype, name, source),
-                        value)
+            res[(name, ttype, lang, source)] = cls.get_source(
+                name, ttype, lang, source)
         return res
 
     @classmethod
     def delete(cls, translations):
         cls._translation_cache.clear()
+        cls._catalog_cache.clear()
         ModelView._fields_view_get_cache.clear()
         return super(Translation, cls).delete(translations)
 
     @classmethod
     def create(cls, vlist):
         cls._translation_cache.clear()
+        cls._catalog_cache.clear()
         ModelView._fields_view_get_cache.clear()
         vlist = [x.copy() for x in vlist]
 
@@ -741,6 +760,7 @@ class Translation(ModelSQL, ModelView):
     @classmethod
     def write(cls, translations, values, *args):
         cls._translation_cache.clear()
+        cls._catalog_cache.clear()
         ModelView._fields_view_get_cache.clear()
         actions = iter((translations, values) + args)
         args = []
@@ -1072,6 +1092,7 @@ class TranslationSet(Wizard):
         pool = Pool()
         Report = pool.get('ir.action.report')
         Translation = pool.get('ir.translation')
+        Translation._catalog_cache.clear()
 
         with Transaction().set_context(active_test=False):
             reports = Report.search([])
@@ -1160,6 +1181,7 @@ class TranslationSet(Wizard):
         pool = Pool()
         View = pool.get('ir.ui.view')
         Translation = pool.get('ir.translation')
+        Translation._catalog_cache.clear()
 
         with Transaction().set_context(active_test=False):
             views = View.search([])
@@ -1510,6 +1532,7 @@ class TranslationUpdate(Wizard):
     def do_update(self, action):
         pool = Pool()
         Translation = pool.get('ir.translation')
+        Translation._catalog_cache.clear()
         cursor = Transaction().connection.cursor()
         cursor_update = Transaction().connection.cursor()
         translation = Translation.__table__()
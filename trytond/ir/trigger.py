@@ -6,7 +6,7 @@ from sql import Literal, Null
 from sql.aggregate import Count, Max
 
 from ..model import ModelView, ModelSQL, fields, EvalEnvironment, Check
-from ..pyson import Eval, PYSONDecoder
+from ..pyson import Eval, PYSONDecoder, evaluator
 from ..tools import grouped_slice
 from .. import backend
 from ..tools import reduce_ids
@@ -176,7 +176,7 @@ class Trigger(ModelSQL, ModelView):
         env['time'] = time
         env['context'] = Transaction().context
         env['self'] = EvalEnvironment(record, record.__class__)
-        return bool(PYSONDecoder(env).decode(trigger.condition))
+        return bool(evaluator(trigger.condition)(env))
 
     @classmethod
     def trigger_action(cls, records, trigger):
@@ -1,5 +1,6 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+from collections import defaultdict
 from itertools import groupby
 
 from sql import Null
@@ -210,14 +211,17 @@ class UIMenu(ModelSQL, ModelView):
                 actions[model.id] = '%s,-1' % type
 
             Action = pool.get(type)
-            action2keyword = {k.action.id: k for k in action_keywords}
+            action2keywords = defaultdict(list)
+            for action_keyword in action_keywords:
+                action2keywords[action_keyword.action.id].append(
+                    action_keyword)
             with Transaction().set_context(active_test=False):
                 factions = Action.search([
-                        ('action', 'in', action2keyword.keys()),
+                        ('action', 'in', action2keywords.keys()),
                         ])
             for action in factions:
-                model = action2keyword[action.id].model
-                actions[model.id] = str(action)
+                for action_keyword in action2keywords[action.action.id]:
+                    actions[action_keyword.model.id] = str(action)
         return actions
 
     @classmethod
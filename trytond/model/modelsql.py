@@ -1,19 +1,23 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
 import datetime
-from itertools import islice, izip, chain, ifilter
-from collections import OrderedDict
-
-from sql import Table, Column, Literal, Desc, Asc, Expression, Null
-from sql.functions import CurrentTimestamp, Extract
-from sql.conditionals import Coalesce
+import hashlib
+import uuid
+from threading import Lock
+from itertools import islice, izip, chain, ifilter, groupby
+from collections import OrderedDict, defaultdict
+
+from sql import (Table, Column, Literal, Desc, Asc, Expression, Null,
+    Window)
+from sql.functions import CurrentTimestamp, Extract, RowNumber
+from sql.conditionals import Coalesce, Case
 from sql.operators import Or, And, Operator
 from sql.aggregate import Count, Max
 
 from trytond.model import ModelStorage, ModelView
 from trytond.model import fields
-from trytond import backend
-from trytond.tools import reduce_ids, grouped_slice, cursor_dict
+from trytond import backend, __version__
+from trytond.tools import reduce_ids, grouped_slice, cursor_dict, array_ids
 from trytond.const import OPERATORS
 from trytond.transaction import Transaction
 from trytond.pool import Pool
@@ -87,6 +91,14 @@ class Unique(Constraint):
         return tuple(p)
 
 
+class _Parameter(object):
+    'Placeholder of a value in a cached query'
+    __slots__ = ('index',)
+
+    def __init__(self, index):
+        self.index = index
+
+
 class ModelSQL(ModelStorage):
     """
     Define a model with storage in database.
@@ -110,6 +122,8 @@ class ModelSQL(ModelStorage):
         cls._table = config.get('table', cls.__name__, default=cls._table)
         if not cls._table:
             cls._table = cls.__name__.replace('.', '_')
+        cls._sql_cache = LRUDict(config.getint('cache', 'query'))
+        cls._sql_cache_lock = Lock()
 
         assert cls._table[-9:] != '__history', \
             'Model _table %s cannot end with "__history"' % cls._table
@@ -135,6 +149,13 @@ class ModelSQL(ModelStorage):
             return
 
         pool = Pool()
+        Fingerprint = pool.get('ir.model.fingerprint')
+
+        fingerprint = cls._fingerprint()
+        if (Fingerprint.get_fingerprint(cls.__name__, module_name)
+                == fingerprint):
+            cls._register_mptt()
+            return
 
         # create/update table in the database
         table = TableHandler(cls, module_name)
@@ -202,20 +223,7 @@ class ModelSQL(ModelStorage):
             table.not_null_action(
                 field_name, action=required and 'add' or 'remove')
 
-        for field_name, field in cls._fields.iteritems():
-            if isinstance(field, fields.Many2One) \
-                    and field.model_name == cls.__name__ \
-                    and field.left and field.right:
-                left_default = cls._defaults.get(field.left, lambda: None)()
-                right_default = cls._defaults.get(field.right, lambda: None)()
-                cursor.execute(*sql_table.select(sql_table.id,
-                        where=(Column(sql_table, field.left) == left_default)
-                        | (Column(sql_table, field.left) == Null)
-                        | (Column(sql_table, field.right) == right_default)
-                        | (Column(sql_table, field.right) == Null),
-                        limit=1))
-                if cursor.fetchone():
-                    cls._rebuild_tree(field_name, None, 0)
+        cls._register_mptt()
 
         for ident, constraint, _ in cls._sql_constraints:
             table.add_constraint(ident, constraint)
@@ -236,6 +244,54 @@ class ModelSQL(ModelStorage):
                     cursor.execute(*history_table.update(
                             [history_table.write_date], [None]))
 
+        Fingerprint.set_fingerprint(cls.__name__, module_name, fingerprint)
+
+    @classmethod
+    def _fingerprint(cls):
+        "Return a digest of the table definition"
+        pool = Pool()
+        definition = [__version__, backend.name(),
+            cls._table, cls.__doc__, bool(cls._history)]
+        for field_name, field in sorted(cls._fields.iteritems()):
+            if hasattr(field, 'set'):
+                continue
+            if hasattr(field, 'size') and isinstance(field.size, int):
+                field_size = field.size
+            else:
+                field_size = None
+            ref = None
+            if isinstance(field, fields.Many2One):
+                if field.model_name in ('res.user', 'res.group'):
+                    ref = field.model_name.replace('.', '_')
+                else:
+                    ref = pool.get(field.model_name)._table
+                ref = (ref, field.ondelete)
+            definition.append((field_name, field.sql_type(), field_size,
+                    bool(field.select), bool(field.required), ref,
+                    field.string))
+        for ident, constraint, _ in cls._sql_constraints:
+            definition.append((ident, str(constraint), constraint.params))
+        return hashlib.md5(repr(definition)).hexdigest()
+
+    @classmethod
+    def _register_mptt(cls):
+        sql_table = cls.__table__()
+        cursor = Transaction().connection.cursor()
+        for field_name, field in cls._fields.iteritems():
+            if isinstance(field, fields.Many2One) \
+                    and field.model_name == cls.__name__ \
+                    and field.left and field.right:
+                left_default = cls._defaults.get(field.left, lambda: None)()
+                right_default = cls._defaults.get(field.right, lambda: None)()
+                cursor.execute(*sql_table.select(sql_table.id,
+                        where=(Column(sql_table, field.left) == left_default)
+                        | (Column(sql_table, field.left) == Null)
+                        | (Column(sql_table, field.right) == right_default)
+                        | (Column(sql_table, field.right) == Null),
+                        limit=1))
+                if cursor.fetchone():
+                    cls._rebuild_tree(field_name, None, 0)
+
     @classmethod
     def _update_history_table(cls):
         TableHandler = backend.get('TableHandler')
@@ -385,6 +441,7 @@ class ModelSQL(ModelStorage):
         hcolumns = []
         fnames = sorted(n for n, f in cls._fields.iteritems()
             if not hasattr(f, 'set'))
+        id_index = fnames.index('id')
         for fname in fnames:
             columns.append(Column(table, fname))
             if fname == 'write_uid':
@@ -398,33 +455,72 @@ class ModelSQL(ModelStorage):
             return all(not v for n, v in zip(fnames, values)
                 if n not in ['id', 'write_uid', 'write_date'])
 
+        column_datetime = Coalesce(history.write_date, history.create_date)
+        history_id = Column(history, '__id')
+        horder = [column_datetime.desc, history_id.desc]
         to_delete = []
         to_update = []
-        for id_ in ids:
-            column_datetime = Coalesce(history.write_date, history.create_date)
+        for sub_ids in grouped_slice(ids):
+            sub_ids = list(sub_ids)
             if not _before:
                 hwhere = (column_datetime <= datetime)
             else:
                 hwhere = (column_datetime < datetime)
-            hwhere &= (history.id == id_)
-            horder = (column_datetime.desc, Column(history, '__id').desc)
-            cursor.execute(*history.select(*hcolumns,
-                    where=hwhere, order_by=horder, limit=1))
-            values = cursor.fetchone()
-            if not values or is_deleted(values):
-                to_delete.append(id_)
+            hwhere &= reduce_ids(history.id, sub_ids)
+            hfields = [Column(history, f) for f in fnames]
+            if transaction.database.has_window_functions():
+                latest = history.select(history_id, *hfields + [
+                        RowNumber(window=Window([history.id],
+                                order_by=horder)).as_('rank')],
+                    where=hwhere)
+                cursor.execute(*latest.select(Column(latest, '__id'),
+                        *[Column(latest, f) for f in fnames],
+                        where=latest.rank == 1))
+                rows = cursor.fetchall()
             else:
-                to_update.append(id_)
-                values = list(values)
-                cursor.execute(*table.update(columns, values,
-                        where=table.id == id_))
-                rowcount = cursor.rowcount
-                if rowcount == -1 or rowcount is None:
-                    cursor.execute(*table.select(table.id,
+                cursor.execute(*history.select(history_id, *hfields,
+                        where=hwhere, order_by=[history.id] + horder))
+                rows = [next(g) for _, g in groupby(
+                        cursor.fetchall(), key=lambda r: r[1 + id_index])]
+            latest_ids = dict((r[1 + id_index], r) for r in rows)
+
+            updates = {}
+            for id_ in sub_ids:
+                row = latest_ids.get(id_)
+                if not row or is_deleted(row[1:]):
+                    to_delete.append(id_)
+                else:
+                    to_update.append(id_)
+                    updates[id_] = row
+            if not updates:
+                continue
+
+            cursor.execute(*table.select(table.id,
+                    where=reduce_ids(table.id, updates.keys())))
+            existing_ids = set(i for i, in cursor.fetchall())
+            to_insert = [updates[i][0] for i in updates
+                if i not in existing_ids]
+            if to_insert:
+                cursor.execute(*table.insert(columns, history.select(
+                            *hcolumns,
+                            where=reduce_ids(history_id, to_insert))))
+            if not existing_ids:
+                continue
+            ucolumns = [c for f, c in zip(fnames, columns) if f != 'id']
+            if transaction.database.has_update_from():
+                cursor.execute(*table.update(ucolumns,
+                        [c for f, c in zip(fnames, hcolumns) if f != 'id'],
+                        from_=[history],
+                        where=(history.id == table.id)
+                        & reduce_ids(history_id,
+                            [updates[i][0] for i in existing_ids])))
+            else:
+                for id_ in existing_ids:
+                    values = [c if not isinstance(c, Column) else v
+                        for f, c, v in zip(fnames, hcolumns, updates[id_][1:])
+                        if f != 'id']
+                    cursor.execute(*table.update(ucolumns, values,
                             where=table.id == id_))
-                    rowcount = len(cursor.fetchall())
-                if rowcount < 1:
-                    cursor.execute(*table.insert(columns, [values]))
 
         if to_delete:
             for sub_ids in grouped_slice(to_delete):
@@ -470,6 +566,36 @@ class ModelSQL(ModelStorage):
                     raise ConcurrencyException(
                         'Records were modified in the meanwhile')
 
+    @classmethod
+    def __insert(cls, table, columns, rows):
+        '''
+        Insert the rows in table and return the new ids in the same order.
+        '''
+        transaction = Transaction()
+        database = transaction.database
+        cursor = transaction.connection.cursor()
+
+        if len(rows) > 1 and not database.has_multirow_insert():
+            return list(chain(*(cls.__insert(table, columns, [row])
+                        for row in rows)))
+
+        if database.has_returning():
+            cursor.execute(*table.insert(columns, rows, [table.id]))
+            return [id_ for id_, in cursor.fetchall()]
+
+        ids = [database.nextid(transaction.connection, cls._table)
+            for _ in rows]
+        if all(ids):
+            cursor.execute(*table.insert(columns + [table.id],
+                    [row + [id_] for row, id_ in izip(rows, ids)]))
+        else:
+            # lastid is only reliable for a single row
+            ids = []
+            for row in rows:
+                cursor.execute(*table.insert(columns, [row]))
+                ids.append(database.lastid(cursor))
+        return ids
+
     @classmethod
     def create(cls, vlist):
         DatabaseIntegrityError = backend.get('DatabaseIntegrityError')
@@ -487,7 +613,6 @@ class ModelSQL(ModelStorage):
         table = cls.__table__()
         modified_fields = set()
         defaults_cache = {}  # Store already computed default values
-        new_ids = []
         vlist = [v.copy() for v in vlist]
         for values in vlist:
             # Clean values
@@ -514,45 +639,40 @@ class ModelSQL(ModelStorage):
                 values.update(defaults)
                 defaults_cache.update(defaults)
 
-            insert_columns = [table.create_uid, table.create_date]
-            insert_values = [transaction.user, CurrentTimestamp()]
-
-            # Insert record
-            for fname, value in values.iteritems():
-                field = cls._fields[fname]
-                if not hasattr(field, 'set'):
-                    insert_columns.append(Column(table, fname))
-                    insert_values.append(field.sql_format(value))
+        def insert_fields(values):
+            return tuple(sorted(fname for fname in values
+                    if not hasattr(cls._fields[fname], 'set')))
 
-            try:
-                if transaction.database.has_returning():
-                    cursor.execute(*table.insert(insert_columns,
-                            [insert_values], [table.id]))
-                    id_new, = cursor.fetchone()
-                else:
-                    id_new = transaction.database.nextid(
-                        transaction.connection, cls._table)
-                    if id_new:
-                        insert_columns.append(table.id)
-                        insert_values.append(id_new)
-                        cursor.execute(*table.insert(insert_columns,
-                                [insert_values]))
-                    else:
-                        cursor.execute(*table.insert(insert_columns,
-                                [insert_values]))
-                        id_new = transaction.database.lastid(cursor)
-                new_ids.append(id_new)
-            except DatabaseIntegrityError, exception:
-                with Transaction().new_transaction(), \
-                        Transaction().set_context(_check_access=False):
-                    cls.__raise_integrity_error(exception, values)
-                raise
+        # Insert consecutive records with the same columns together
+        # to keep the ids in the order of vlist
+        new_ids = []
+        for fnames, sub_vlist in groupby(vlist, key=insert_fields):
+            sub_vlist = list(sub_vlist)
+            insert_columns = [table.create_uid, table.create_date]
+            insert_columns += [Column(table, f) for f in fnames]
+            in_max = max(
+                transaction.database.IN_MAX // len(insert_columns), 1)
+            for sub_values in grouped_slice(sub_vlist, in_max):
+                sub_values = list(sub_values)
+                insert_values = []
+                for values in sub_values:
+                    insert_values.append([transaction.user, CurrentTimestamp()]
+                        + [cls._fields[f].sql_format(values[f])
+                            for f in fnames])
+                try:
+                    new_ids.extend(cls.__insert(
+                            table, insert_columns, insert_values))
+                except DatabaseIntegrityError, exception:
+                    with Transaction().new_transaction(), \
+                            Transaction().set_context(_check_access=False):
+                        for values in sub_values:
+                            cls.__raise_integrity_error(exception, values)
+                    raise
 
         domain = Rule.domain_get(cls.__name__, mode='create')
         if domain:
             tables = {None: (table, None)}
-            tables, expression = cls.search_domain(
-                domain, active_test=False, tables=tables)
+            tables, expression = cls.__rule_domain(domain, 'create', tables)
             from_ = convert_from(None, tables)
             for sub_ids in grouped_slice(new_ids):
                 sub_ids = list(sub_ids)
@@ -600,8 +720,10 @@ class ModelSQL(ModelStorage):
         for sub_records in grouped_slice(records, cache_size()):
             cls._validate(sub_records)
 
+        # The new records are inserted in the tree as they have left and
+        # right at 0 and those from nested creation are already inserted
         field_names = cls._fields.keys()
-        cls._update_mptt(field_names, [new_ids] * len(field_names))
+        cls._update_mptt(field_names, [[]] * len(field_names))
 
         cls.trigger_create(records)
         return records
@@ -677,19 +799,25 @@ class ModelSQL(ModelStorage):
 
             tables = {None: (table, None)}
             if domain:
-                tables, dom_exp = cls.search_domain(
-                    domain, active_test=False, tables=tables)
+                tables, dom_exp = cls.__rule_domain(domain, 'read', tables)
             from_ = convert_from(None, tables)
+            # The query depends only on the columns and the number of ids
+            cached = (not domain and not history_clause and not table_query
+                and all(isinstance(c.expression, Column)
+                    or c.output_name == '_timestamp' for c in columns))
             for sub_ids in grouped_slice(ids, in_max):
                 sub_ids = list(sub_ids)
-                red_sql = reduce_ids(table.id, sub_ids)
-                where = red_sql
-                if history_clause:
-                    where &= history_clause
-                if domain:
-                    where &= dom_exp
-                cursor.execute(*from_.select(*columns, where=where,
-                        order_by=history_order, limit=history_limit))
+                if cached:
+                    cursor.execute(*cls.__read_query(table, columns, sub_ids))
+                else:
+                    red_sql = reduce_ids(table.id, sub_ids)
+                    where = red_sql
+                    if history_clause:
+                        where &= history_clause
+                    if domain:
+                        where &= dom_exp
+                    cursor.execute(*from_.select(*columns, where=where,
+                            order_by=history_order, limit=history_limit))
                 fetchall = list(cursor_dict(cursor))
                 if not len(fetchall) == len({}.fromkeys(sub_ids)):
                     if domain:
@@ -721,6 +849,17 @@ class ModelSQL(ModelStorage):
                 for row in result:
                     row[field] = translations.get(row['id']) or row[field]
 
+        # The rows are not resolved with one history query for all the
+        # (id, datetime) pairs even when the database has_window_functions
+        # because the getters and the related targets must be called with
+        # the _datetime in the context, so they are grouped per datetime.
+        def datetime_groups(rows, datetime_field):
+            "Group rows per value of the datetime field"
+            groups = OrderedDict()
+            for row in rows:
+                groups.setdefault(row[datetime_field], []).append(row)
+            return groups.iteritems()
+
         # all fields for which there is a get attribute
         getter_fields = [f for f in
             fields_names + fields_related.keys() + datetime_fields
@@ -733,12 +872,14 @@ class ModelSQL(ModelStorage):
                 func_fields.setdefault(key, [])
                 func_fields[key].append(fname)
             elif getattr(field, 'datetime_field', None):
-                for row in result:
-                    with Transaction().set_context(
-                            _datetime=row[field.datetime_field]):
-                        date_result = field.get([row['id']], cls, fname,
-                            values=[row])
-                    row[fname] = date_result[row['id']]
+                for datetime_, sub_result in datetime_groups(
+                        result, field.datetime_field):
+                    with Transaction().set_context(_datetime=datetime_):
+                        date_result = field.get(
+                            [r['id'] for r in sub_result], cls, fname,
+                            values=sub_result)
+                    for row in sub_result:
+                        row[fname] = date_result[row['id']]
             else:
                 # get the value of that field for all records/ids
                 getter_result = field.get(ids, cls, fname, values=result)
@@ -751,13 +892,15 @@ class ModelSQL(ModelStorage):
             field = cls._fields[fname]
             _, datetime_field = key
             if datetime_field:
-                for row in result:
-                    with Transaction().set_context(
-                            _datetime=row[datetime_field]):
-                        date_results = field.get([row['id']], cls, field_list,
-                            values=[row])
+                for datetime_, sub_result in datetime_groups(
+                        result, datetime_field):
+                    with Transaction().set_context(_datetime=datetime_):
+                        date_results = field.get(
+                            [r['id'] for r in sub_result], cls, field_list,
+                            values=sub_result)
                     for fname, date_result in date_results.iteritems():
-                        row[fname] = date_result[row['id']]
+                        for row in sub_result:
+                            row[fname] = date_result[row['id']]
             else:
                 getter_results = field.get(ids, cls, field_list, values=result)
                 for fname, getter_result in getter_results.iteritems():
@@ -781,27 +924,27 @@ class ModelSQL(ModelStorage):
                 else:
                     Target = field.get_target()
                 if getattr(field, 'datetime_field', None):
-                    for row in result:
-                        if row[fname] is None:
+                    for datetime_, sub_result in datetime_groups(
+                            result, field.datetime_field):
+                        target_ids = list({r[fname] for r in sub_result
+                                if r[fname] is not None})
+                        if not target_ids:
                             continue
-                        with Transaction().set_context(
-                                _datetime=row[field.datetime_field]):
-                            date_target, = Target.read([row[fname]],
+                        with Transaction().set_context(_datetime=datetime_):
+                            date_targets = Target.read(target_ids,
                                 fields_related[fname])
-                        target_id = date_target.pop('id')
-                        fields_related2values[fname].setdefault(target_id, {})
-                        fields_related2values[
-                            fname][target_id][row['id']] = date_target
+                        for date_target in date_targets:
+                            target_id = date_target.pop('id')
+                            fields_related2values[fname][
+                                (datetime_, target_id)] = date_target
                 else:
                     for target in Target.read(
-                            [r[fname] for r in result if r[fname]],
+                            list({r[fname] for r in result if r[fname]}),
                             fields_related[fname]):
                         target_id = target.pop('id')
-                        fields_related2values[fname].setdefault(target_id, {})
-                        for row in result:
-                            fields_related2values[
-                                fname][target_id][row['id']] = target
+                        fields_related2values[fname][target_id] = target
             elif field._type == 'reference':
+                targets = {}
                 for row in result:
                     if not row[fname]:
                         continue
@@ -811,10 +954,14 @@ class ModelSQL(ModelStorage):
                     record_id = int(record_id)
                     if record_id < 0:
                         continue
+                    targets.setdefault(model_name, set()).add(record_id)
+                for model_name, record_ids in targets.iteritems():
                     Target = pool.get(model_name)
-                    target, = Target.read([record_id], fields_related[fname])
-                    del target['id']
-                    fields_related2values[fname][row[fname]] = target
+                    for target in Target.read(
+                            list(record_ids), fields_related[fname]):
+                        target_id = target.pop('id')
+                        fields_related2values[fname][
+                            (model_name, target_id)] = target
 
         if to_del or fields_related or datetime_fields:
             for row in result:
@@ -827,8 +974,13 @@ class ModelSQL(ModelStorage):
                         value = None
                         if row[fname]:
                             if field._type in ('many2one', 'one2one'):
+                                if getattr(field, 'datetime_field', None):
+                                    key = (row[field.datetime_field],
+                                        row[fname])
+                                else:
+                                    key = row[fname]
                                 value = fields_related2values[fname][
-                                    row[fname]][row['id']][related]
+                                    key][related]
                             elif field._type == 'reference':
                                 model_name, record_id = row[fname
                                     ].split(',', 1)
@@ -836,13 +988,45 @@ class ModelSQL(ModelStorage):
                                     record_id = int(record_id)
                                     if record_id >= 0:
                                         value = fields_related2values[fname][
-                                            row[fname]][related]
+                                            (model_name, record_id)][related]
                         row[related_name] = value
                 for field in to_del:
                     del row[field]
 
         return result
 
+    @classmethod
+    def __read_query(cls, table, columns, ids):
+        "Return the query to read the columns of ids"
+        key = ('read',) + tuple(c.output_name for c in columns)
+        if Transaction().database.has_array():
+            return cls._cached_query(key,
+                lambda ids: table.select(*columns,
+                    where=array_ids(table.id, ids)),
+                [ids])
+        else:
+            return cls._cached_query(key + (len(ids),),
+                lambda *ids: table.select(*columns,
+                    where=table.id.in_(list(ids))),
+                ids)
+
+    @classmethod
+    def _cached_query(cls, key, build, values):
+        '''
+        Return the SQL and the parameters of the query for the values.
+        The query is built by calling build with a placeholder per value
+        and its SQL is cached per key which must identify its structure.
+        '''
+        with cls._sql_cache_lock:
+            cached = cls._sql_cache.get(key)
+        if cached is None:
+            cached = tuple(build(*map(_Parameter, range(len(values)))))
+            with cls._sql_cache_lock:
+                cls._sql_cache[key] = cached
+        sql, params = cached
+        return sql, [values[p.index] if isinstance(p, _Parameter) else p
+            for p in params]
+
     @classmethod
     def write(cls, records, values, *args):
         DatabaseIntegrityError = backend.get('DatabaseIntegrityError')
@@ -898,8 +1082,7 @@ class ModelSQL(ModelStorage):
             domain = Rule.domain_get(cls.__name__, mode='write')
             tables = {None: (table, None)}
             if domain:
-                tables, dom_exp = cls.search_domain(
-                    domain, active_test=False, tables=tables)
+                tables, dom_exp = cls.__rule_domain(domain, 'write', tables)
             from_ = convert_from(None, tables)
             for sub_ids in grouped_slice(ids):
                 sub_ids = list(sub_ids)
@@ -992,23 +1175,20 @@ class ModelSQL(ModelStorage):
         foreign_keys_tocheck = []
         foreign_keys_toupdate = []
         foreign_keys_todelete = []
-        for _, model in pool.iterobject():
+        for model_name, field_name in pool.get_references(cls.__name__):
+            model = pool.get(model_name)
             if hasattr(model, 'table_query') and model.table_query():
                 continue
-            if not issubclass(model, ModelStorage):
-                continue
-            for field_name, field in model._fields.iteritems():
-                if (isinstance(field, fields.Many2One)
-                        and field.model_name == cls.__name__):
-                    if field.ondelete == 'CASCADE':
-                        foreign_keys_todelete.append((model, field_name))
-                    elif field.ondelete == 'SET NULL':
-                        if field.required:
-                            foreign_keys_tocheck.append((model, field_name))
-                        else:
-                            foreign_keys_toupdate.append((model, field_name))
-                    else:
-                        foreign_keys_tocheck.append((model, field_name))
+            field = model._fields[field_name]
+            if field.ondelete == 'CASCADE':
+                foreign_keys_todelete.append((model, field_name))
+            elif field.ondelete == 'SET NULL':
+                if field.required:
+                    foreign_keys_tocheck.append((model, field_name))
+                else:
+                    foreign_keys_toupdate.append((model, field_name))
+            else:
+                foreign_keys_tocheck.append((model, field_name))
 
         transaction.delete.setdefault(cls.__name__, set()).update(ids)
 
@@ -1016,8 +1196,7 @@ class ModelSQL(ModelStorage):
 
         if domain:
             tables = {None: (table, None)}
-            tables, dom_exp = cls.search_domain(
-                domain, active_test=False, tables=tables)
+            tables, dom_exp = cls.__rule_domain(domain, 'delete', tables)
             from_ = convert_from(None, tables)
             for sub_ids in grouped_slice(ids):
                 sub_ids = list(sub_ids)
@@ -1121,8 +1300,7 @@ class ModelSQL(ModelStorage):
         # construct a clause for the rules :
         domain = Rule.domain_get(cls.__name__, mode='read')
         if domain:
-            tables, dom_exp = cls.search_domain(
-                domain, active_test=False, tables=tables)
+            tables, dom_exp = cls.__rule_domain(domain, 'read', tables)
             expression &= dom_exp
 
         main_table, _ = tables[None]
@@ -1241,6 +1419,82 @@ class ModelSQL(ModelStorage):
 
         return cls.browse([x['id'] for x in rows])
 
+    @classmethod
+    def search_iter(cls, domain, order=None):
+        '''
+        Yield the records that match the domain without fetching all the ids
+        at once. The records are browsed by chunk of IN_MAX and ordered by id
+        if no order is given.
+        '''
+        transaction = Transaction()
+        database = transaction.database
+        size = database.IN_MAX
+        if order is None:
+            order = [('id', 'ASC')]
+
+        if cls._history and transaction.context.get('_datetime'):
+            # The history filtering needs all the rows of the records
+            for sub_records in grouped_slice(
+                    cls.search(domain, order=order), size):
+                for record in cls.browse(sub_records):
+                    yield record
+            return
+
+        if database.has_server_cursor():
+            select = cls.search(domain, order=order, query=True)
+            cursor = transaction.connection.cursor(
+                'search_iter_' + uuid.uuid4().hex)
+            try:
+                cursor.execute(*select)
+                while True:
+                    ids = [r[0] for r in cursor.fetchmany(size)]
+                    if not ids:
+                        break
+                    for record in cls.browse(ids):
+                        yield record
+            finally:
+                cursor.close()
+            return
+
+        # Use keyset pagination when ordered only by id
+        keyset = None
+        if len(order) == 1 and order[0][0] == 'id':
+            keyset = '>' if order[0][1].upper() == 'ASC' else '<'
+        cursor = transaction.connection.cursor()
+        offset, last_id = 0, None
+        while True:
+            if keyset and last_id is not None:
+                select = cls.search([domain, ('id', keyset, last_id)],
+                    limit=size, order=order, query=True)
+            else:
+                select = cls.search(domain,
+                    offset=offset, limit=size, order=order, query=True)
+            cursor.execute(*select)
+            ids = [r[0] for r in cursor.fetchall()]
+            if not ids:
+                break
+            offset += len(ids)
+            last_id = ids[-1]
+            for record in cls.browse(ids):
+                yield record
+            if len(ids) < size:
+                break
+
+    @classmethod
+    def __rule_domain(cls, domain, mode, tables):
+        '''
+        Return the tables and the expression of the rule domain for the mode
+        '''
+        pool = Pool()
+        Rule = pool.get('ir.rule')
+        table, _ = tables[None]
+        if ((cls._history and Transaction().context.get('_datetime'))
+                or not Rule._domain_plain(cls, domain)):
+            # The rule must be applied on the history rows and the nested
+            # clauses must be converted with the rules of the user
+            return cls.search_domain(domain, active_test=False, tables=tables)
+        return tables, table.id.in_(Rule.query_get(cls.__name__, mode=mode))
+
     @classmethod
     def search_domain(cls, domain, active_test=True, tables=None):
         '''
@@ -1302,7 +1556,7 @@ class ModelSQL(ModelStorage):
                         'You can not update fields: "%s", "%s"' %
                         (field.left, field.right))
 
-                # Nested creation require a rebuild
+                # Existing records under a new parent require a rebuild
                 # because initial values are 0
                 # and thus _update_tree can not find the children
                 table = cls.__table__()
@@ -1311,11 +1565,18 @@ class ModelSQL(ModelStorage):
                         condition=Column(table, field_name) == parent.id
                         ).select(table.id,
                         where=(Column(parent, field.left) == 0)
-                        & (Column(parent, field.right) == 0)))
-                nested_create = cursor.fetchone()
+                        & (Column(parent, field.right) == 0)
+                        & ((Column(table, field.left) != 0)
+                            | (Column(table, field.right) != 0)),
+                        limit=1))
+                if cursor.fetchone():
+                    cls._rebuild_tree(field_name, None, 0)
+                    continue
 
-                if not nested_create and len(ids) < 2:
-                    for id_ in ids:
+                new_ids = cls._insert_tree(field_name)
+                moved_ids = [i for i in ids if i not in new_ids]
+                if len(moved_ids) < 2:
+                    for id_ in moved_ids:
                         cls._update_tree(id_, field_name,
                             field.left, field.right)
                 else:
@@ -1328,23 +1589,135 @@ class ModelSQL(ModelStorage):
         '''
         cursor = Transaction().connection.cursor()
         table = cls.__table__()
-        right = left + 1
+        field = cls._fields[parent]
 
-        cursor.execute(*table.select(table.id,
-                where=Column(table, parent) == parent_id))
-        childs = cursor.fetchall()
+        cursor.execute(*table.select(table.id, Column(table, parent),
+                Column(table, field.left), Column(table, field.right),
+                order_by=table.id.asc))
+        childs = defaultdict(list)
+        current = {}
+        for id_, parent_id_, left_, right_ in cursor.fetchall():
+            childs[parent_id_].append(id_)
+            current[id_] = (left_, right_)
+
+        tree = {}
+        right = cls._number_tree(childs, parent_id, left + 1, tree)
+        if parent_id:
+            tree[parent_id] = (left, right)
+        cls._write_tree(parent, dict((id_, value)
+                for id_, value in tree.iteritems()
+                if current.get(id_) != value))
+        return right + 1
 
-        for child_id, in childs:
-            right = cls._rebuild_tree(parent, child_id, right)
+    @classmethod
+    def _number_tree(cls, childs, parent_id, left, tree):
+        '''
+        Fill tree with the left, right values of the descendants of parent_id
+        starting at left and return the next value.
+        '''
+        stack = [(parent_id, iter(childs.get(parent_id, [])), None)]
+        while stack:
+            node_id, children, node_left = stack[-1]
+            for child_id in children:
+                stack.append(
+                    (child_id, iter(childs.get(child_id, [])), left))
+                left += 1
+                break
+            else:
+                stack.pop()
+                if node_left is not None:
+                    tree[node_id] = (node_left, left)
+                    left += 1
+        return left
 
+    @classmethod
+    def _write_tree(cls, parent, values):
+        '''
+        Write the left, right values by batch.
+        values is a dictionary of id to (left, right).
+        '''
+        transaction = Transaction()
+        cursor = transaction.connection.cursor()
+        table = cls.__table__()
         field = cls._fields[parent]
+        left = Column(table, field.left)
+        right = Column(table, field.right)
+        in_max = transaction.database.IN_MAX // 5
+        for sub_ids in grouped_slice(sorted(values), in_max):
+            sub_ids = list(sub_ids)
+            cursor.execute(*table.update([left, right], [
+                        Case(*[(table.id == i, values[i][0])
+                                for i in sub_ids]),
+                        Case(*[(table.id == i, values[i][1])
+                                for i in sub_ids]),
+                        ],
+                    where=reduce_ids(table.id, sub_ids)))
 
-        if parent_id:
-            cursor.execute(*table.update(
-                    [Column(table, field.left), Column(table, field.right)],
-                    [left, right],
-                    where=table.id == parent_id))
-        return right + 1
+    @classmethod
+    def _insert_tree(cls, field_name):
+        '''
+        Insert the new records (with left and right at 0) into the tree
+        and return their ids.
+        The new records are appended as last children of their parent.
+        '''
+        transaction = Transaction()
+        cursor = transaction.connection.cursor()
+        table = cls.__table__()
+        field = cls._fields[field_name]
+        left = Column(table, field.left)
+        right = Column(table, field.right)
+        parent = Column(table, field_name)
+
+        cursor.execute(*table.select(table.id, parent,
+                where=(left == 0) & (right == 0),
+                order_by=table.id.asc))
+        childs = defaultdict(list)
+        new_ids = set()
+        for id_, parent_id in cursor.fetchall():
+            childs[parent_id].append(id_)
+            new_ids.add(id_)
+        if not new_ids:
+            return new_ids
+
+        # The new records are inserted at the right of their parent
+        positions = {}
+        parent_ids = [p for p in childs if p not in new_ids]
+        if None in parent_ids:
+            cursor.execute(*table.select(Max(right), where=parent == Null))
+            max_right, = cursor.fetchone()
+            positions[None] = (max_right or 0) + 1
+        for sub_ids in grouped_slice(filter(None, parent_ids)):
+            cursor.execute(*table.select(table.id, right,
+                    where=reduce_ids(table.id, sub_ids)))
+            positions.update(cursor.fetchall())
+
+        tree = {}
+        gaps = []
+        shift = 0
+        for parent_id in sorted(positions, key=positions.get):
+            position = positions[parent_id]
+            start = position + shift
+            end = cls._number_tree(childs, parent_id, start, tree)
+            shift += end - start
+            gaps.append((position, shift))
+
+        # Open the gaps from the highest positions
+        # so already shifted values are still shifted by the lower gaps
+        in_max = transaction.database.IN_MAX // 4
+        for i in reversed(xrange(0, len(gaps), in_max)):
+            sub_gaps = gaps[i:i + in_max]
+            base = gaps[i - 1][1] if i else 0
+            lowest = sub_gaps[0][0]
+
+            def shifted(column):
+                return Case(*[(column >= p, column + (s - base))
+                        for p, s in reversed(sub_gaps)], else_=column)
+            cursor.execute(*table.update([left, right],
+                    [shifted(left), shifted(right)],
+                    where=(left >= lowest) | (right >= lowest)))
+
+        cls._write_tree(field_name, tree)
+        return new_ids
 
     @classmethod
     def _update_tree(cls, record_id, field_name, left, right):
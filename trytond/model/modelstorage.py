@@ -16,7 +16,7 @@ from trytond.model import Model
 from trytond.model import fields
 from trytond.tools import reduce_domain, memoize, is_instance_method, \
     grouped_slice
-from trytond.pyson import PYSONEncoder, PYSONDecoder, PYSON
+from trytond.pyson import PYSONEncoder, PYSON, evaluator
 from trytond.const import OPERATORS
 from trytond.config import config
 from trytond.transaction import Transaction
@@ -35,6 +35,44 @@ def cache_size():
         config.getint('cache', 'record'))
 
 
+class _RecordIds(list):
+    "List of ids shared by instances which knows the position of each id"
+
+    def __init__(self, ids=()):
+        super(_RecordIds, self).__init__()
+        self._positions = {}
+        self.extend(ids)
+
+    def append(self, id_):
+        self._positions.setdefault(id_, len(self))
+        super(_RecordIds, self).append(id_)
+
+    def extend(self, ids):
+        for id_ in ids:
+            self.append(id_)
+
+    def remove(self, id_):
+        super(_RecordIds, self).remove(id_)
+        self._positions = {}
+        for position, other in enumerate(self):
+            self._positions.setdefault(other, position)
+
+    def __contains__(self, id_):
+        return id_ in self._positions
+
+    def index(self, id_):
+        try:
+            return self._positions[id_]
+        except KeyError:
+            raise ValueError('%r is not in list' % id_)
+
+    def siblings(self, id_):
+        "Iterate over the ids starting from id_ and wrapping around"
+        index = self.index(id_)
+        for position in chain(xrange(index, len(self)), xrange(index)):
+            yield self[position]
+
+
 class ModelStorage(Model):
     """
     Define a model with storage capability in Tryton.
@@ -451,7 +489,7 @@ class ModelStorage(Model):
         Return a list of instance for the ids
         '''
         transaction = Transaction()
-        ids = map(int, ids)
+        ids = _RecordIds(map(int, ids))
         local_cache = LRUDictTransaction(cache_size())
         transaction_cache = transaction.get_cache()
         return [cls(x, _ids=ids,
@@ -460,7 +498,7 @@ class ModelStorage(Model):
                 _transaction=transaction) for x in ids]
 
     @staticmethod
-    def __export_row(record, fields_names):
+    def __export_row(record, fields_names, pysons):
         pool = Pool()
         lines = []
         data = ['' for x in range(len(fields_names))]
@@ -481,16 +519,18 @@ class ModelStorage(Model):
                 eModel = pool.get(value.__name__)
                 field = eModel._fields[field_name]
                 if field.states and 'invisible' in field.states:
-                    pyson_invisible = PYSONEncoder().encode(
-                            field.states['invisible'])
+                    key = (eModel.__name__, field_name)
+                    if key not in pysons:
+                        pysons[key] = evaluator(PYSONEncoder().encode(
+                                field.states['invisible']))
+                    pyson_invisible = pysons[key]
                     env = EvalEnvironment(value, eModel)
                     env.update(Transaction().context)
                     env['current_date'] = datetime.datetime.today()
                     env['time'] = time
                     env['context'] = Transaction().context
                     env['active_id'] = value.id
-                    invisible = PYSONDecoder(env).decode(pyson_invisible)
-                    if invisible:
+                    if pyson_invisible(env):
                         value = ''
                         break
                 if descriptor:
@@ -506,7 +546,7 @@ class ModelStorage(Model):
                     done.append(child_fields_names)
                     for child_record in value:
                         child_lines = ModelStorage.__export_row(child_record,
-                                child_fields_names)
+                                child_fields_names, pysons)
                         if first:
                             for child_fpos in xrange(len(fields_names)):
                                 if child_lines and child_lines[0][child_fpos]:
@@ -535,8 +575,9 @@ class ModelStorage(Model):
         '''
         fields_names = [x.split('/') for x in fields_names]
         data = []
+        pysons = {}
         for record in records:
-            data += cls.__export_row(record, fields_names)
+            data += cls.__export_row(record, fields_names, pysons)
         return data
 
     @classmethod
@@ -923,7 +964,7 @@ class ModelStorage(Model):
                 Relation = cls
             domains = defaultdict(list)
             if is_pyson(field.domain):
-                pyson_domain = PYSONEncoder().encode(field.domain)
+                pyson_domain = evaluator(PYSONEncoder().encode(field.domain))
                 for record in records:
                     env = EvalEnvironment(record, cls)
                     env.update(Transaction().context)
@@ -931,8 +972,7 @@ class ModelStorage(Model):
                     env['time'] = time
                     env['context'] = Transaction().context
                     env['active_id'] = record.id
-                    domain = freeze(PYSONDecoder(env).decode(pyson_domain))
-                    domains[domain].append(record)
+                    domains[freeze(pyson_domain(env))].append(record)
             else:
                 domains[freeze(field.domain)].extend(records)
 
@@ -989,8 +1029,8 @@ class ModelStorage(Model):
                 # validate states required
                 if field.states and 'required' in field.states:
                     if is_pyson(field.states['required']):
-                        pyson_required = PYSONEncoder().encode(
-                                field.states['required'])
+                        pyson_required = evaluator(PYSONEncoder().encode(
+                                field.states['required']))
                         for record in records:
                             env = EvalEnvironment(record, cls)
                             env.update(Transaction().context)
@@ -998,8 +1038,7 @@ class ModelStorage(Model):
                             env['time'] = time
                             env['context'] = Transaction().context
                             env['active_id'] = record.id
-                            required = PYSONDecoder(env).decode(pyson_required)
-                            if required:
+                            if pyson_required(env):
                                 required_test(getattr(record, field_name),
                                     field_name)
                     else:
@@ -1013,16 +1052,18 @@ class ModelStorage(Model):
                         required_test(getattr(record, field_name), field_name)
                 # validate size
                 if hasattr(field, 'size') and field.size is not None:
+                    if isinstance(field.size, PYSON):
+                        pyson_size = evaluator(
+                            PYSONEncoder().encode(field.size))
                     for record in records:
                         if isinstance(field.size, PYSON):
-                            pyson_size = PYSONEncoder().encode(field.size)
                             env = EvalEnvironment(record, cls)
                             env.update(Transaction().context)
                             env['current_date'] = datetime.datetime.today()
                             env['time'] = time
                             env['context'] = Transaction().context
                             env['active_id'] = record.id
-                            field_size = PYSONDecoder(env).decode(pyson_size)
+                            field_size = pyson_size(env)
                         else:
                             field_size = field.size
                         size = len(getattr(record, field_name) or '')
@@ -1051,7 +1092,8 @@ class ModelStorage(Model):
                 # validate digits
                 if hasattr(field, 'digits') and field.digits:
                     if is_pyson(field.digits):
-                        pyson_digits = PYSONEncoder().encode(field.digits)
+                        pyson_digits = evaluator(
+                            PYSONEncoder().encode(field.digits))
                         for record in records:
                             env = EvalEnvironment(record, cls)
                             env.update(Transaction().context)
@@ -1059,7 +1101,7 @@ class ModelStorage(Model):
                             env['time'] = time
                             env['context'] = Transaction().context
                             env['active_id'] = record.id
-                            digits = PYSONDecoder(env).decode(pyson_digits)
+                            digits = pyson_digits(env)
                             digits_test(getattr(record, field_name), digits,
                                 field_name)
                     else:
@@ -1111,7 +1153,8 @@ class ModelStorage(Model):
                 if (field._type in ('datetime', 'time')
                         and field_name not in ('create_date', 'write_date')):
                     if is_pyson(field.format):
-                        pyson_format = PYSONDecoder().encode(field.format)
+                        pyson_format = evaluator(
+                            PYSONEncoder().encode(field.format))
                         for record in records:
                             env = EvalEnvironment(record, cls)
                             env.update(Transaction().context)
@@ -1119,7 +1162,7 @@ class ModelStorage(Model):
                             env['time'] = time
                             env['context'] = Transaction().context
                             env['active_id'] = record.id
-                            format = PYSONDecoder(env).decode(pyson_format)
+                            format = pyson_format(env)
                             format_test(getattr(record, field_name), format,
                                 field_name)
                     else:
@@ -1283,12 +1326,15 @@ class ModelStorage(Model):
                 if id_ not in s:
                     s.add(id_)
                     yield id_
-        index = self._ids.index(self.id)
-        ids = chain(islice(self._ids, index, None),
-            islice(self._ids, 0, max(index - 1, 0)))
-        ids = islice(unique(ifilter(filter_, ids)),
+        if isinstance(self._ids, _RecordIds):
+            siblings = self._ids.siblings
+        else:
+            siblings = _RecordIds(self._ids).siblings
+        ids = islice(unique(ifilter(filter_, siblings(self.id))),
             self._transaction.database.IN_MAX)
 
+        pyson_contexts = {}
+
         def instantiate(field, value, data):
             if field._type in ('many2one', 'one2one', 'reference'):
                 if value is None or value is False:
@@ -1311,8 +1357,10 @@ class ModelStorage(Model):
             transaction = Transaction()
             ctx = {}
             if field.context:
-                pyson_context = PYSONEncoder().encode(field.context)
-                ctx.update(PYSONDecoder(data).decode(pyson_context))
+                if field.name not in pyson_contexts:
+                    pyson_contexts[field.name] = evaluator(
+                        PYSONEncoder().encode(field.context))
+                ctx.update(pyson_contexts[field.name](data))
             datetime_ = None
             if getattr(field, 'datetime_field', None):
                 datetime_ = data.get(field.datetime_field)
@@ -1322,7 +1370,8 @@ class ModelStorage(Model):
                 key = (Model, freeze(ctx))
                 kwargs['_local_cache'] = model2cache.setdefault(key,
                     LRUDictTransaction(cache_size()))
-                kwargs['_ids'] = ids = model2ids.setdefault(key, [])
+                kwargs['_ids'] = ids = model2ids.setdefault(key,
+                    _RecordIds())
                 kwargs['_transaction_cache'] = transaction.get_cache()
                 kwargs['_transaction'] = transaction
                 if field._type in ('many2one', 'one2one', 'reference'):
@@ -1341,8 +1390,7 @@ class ModelStorage(Model):
                 self._transaction.set_context(self._context):
             if self.id in self._cache and name in self._cache[self.id]:
                 # Use values from cache
-                ids = islice(chain(islice(self._ids, index, None),
-                        islice(self._ids, 0, max(index - 1, 0))),
+                ids = islice(siblings(self.id),
                     self._transaction.database.IN_MAX)
                 ffields = {name: ffields[name]}
                 read_data = [{'id': i, name: self._cache[i][name]}
@@ -9,6 +9,8 @@ import imp
 import operator
 import ConfigParser
 from glob import iglob
+from hashlib import md5
+from io import BytesIO
 
 from sql import Table
 from sql.functions import CurrentTimestamp
@@ -24,6 +26,7 @@ logger = logging.getLogger(__name__)
 
 ir_module = Table('ir_module')
 ir_model_data = Table('ir_model_data')
+ir_model_fingerprint = Table('ir_model_fingerprint')
 
 OPJ = os.path.join
 MODULES_PATH = os.path.abspath(os.path.dirname(__file__))
@@ -198,11 +201,20 @@ def is_module_to_install(module, update):
     return False
 
 
-def load_module_graph(graph, pool, update=None, lang=None):
+def _digest(content, installed_modules=None):
+    digest = md5(content)
+    # The data loaded depends on the installed modules
+    if installed_modules is not None and 'depends' in content:
+        digest.update(','.join(sorted(installed_modules)))
+    return digest.hexdigest()
+
+
+def load_module_graph(graph, pool, update=None, lang=None, force=False):
     if lang is None:
         lang = [config.get('database', 'language')]
     if update is None:
         update = []
+    TableHandler = backend.get('TableHandler')
     modules_todo = []
     models_to_update_history = set()
 
@@ -212,6 +224,10 @@ def load_module_graph(graph, pool, update=None, lang=None):
                 where=ir_module.name.in_(modules)))
         module2state = dict(cursor.fetchall())
 
+        if (update and force
+                and TableHandler.table_exist(ir_model_fingerprint._name)):
+            cursor.execute(*ir_model_fingerprint.delete())
+
         for package in graph:
             module = package.name
             if module not in MODULES:
@@ -239,16 +255,37 @@ def load_module_graph(graph, pool, update=None, lang=None):
                     if hasattr(model, '_history'):
                         models_to_update_history.add(model.__name__)
 
+                ModuleFile = pool.get('ir.module.file')
+                ledger = TableHandler.table_exist(ModuleFile._table)
+                # Skip the files which are unchanged since the last load
+                incremental = (ledger and not force
+                    and package_state == 'to upgrade')
+
                 # Instanciate a new parser for the package:
                 tryton_parser = convert.TrytondXmlHandler(pool=pool,
                     module=module, module_state=package_state)
 
+                filenames = []
                 for filename in package.info.get('xml', []):
                     filename = filename.replace('/', os.sep)
+                    filenames.append(filename)
+                    with tools.file_open(OPJ(module, filename), 'rb') as fp:
+                        content = fp.read()
+                    digest = _digest(content, tryton_parser.installed_modules)
+                    if incremental:
+                        fs_ids = ModuleFile.get_xml(module, filename, digest)
+                        if fs_ids is not None:
+                            logger.info('%s:skipping %s', module, filename)
+                            tryton_parser.to_delete.difference_update(
+                                i for m, i in fs_ids if m == module)
+                            continue
                     logger.info('%s:loading %s', module, filename)
+                    tryton_parser.fs_ids.clear()
                     # Feed the parser with xml content:
-                    with tools.file_open(OPJ(module, filename), 'rb') as fp:
-                        tryton_parser.parse_xmlstream(fp)
+                    tryton_parser.parse_xmlstream(BytesIO(content))
+                    if ledger:
+                        ModuleFile.set_file(module, filename, digest,
+                            tryton_parser.fs_ids)
 
                 modules_todo.append((module, list(tryton_parser.to_delete)))
 
@@ -260,10 +297,21 @@ def load_module_graph(graph, pool, update=None, lang=None):
                     lang2 = os.path.splitext(os.path.basename(filename))[0]
                     if lang2 not in lang:
                         continue
-                    logger.info('%s:loading %s', module,
-                        filename[len(package.info['directory']) + 1:])
+                    name = filename[len(package.info['directory']) + 1:]
+                    filenames.append(name)
+                    with open(filename, 'rb') as fp:
+                        digest = _digest(fp.read())
+                    if incremental and ModuleFile.is_po_unchanged(
+                            module, name, digest, lang2):
+                        logger.info('%s:skipping %s', module, name)
+                        continue
+                    logger.info('%s:loading %s', module, name)
                     Translation = pool.get('ir.translation')
                     Translation.translation_import(lang2, module, filename)
+                    if ledger:
+                        ModuleFile.set_file(module, name, digest)
+                if ledger:
+                    ModuleFile.clean(module, filenames)
 
                 if package_state == 'to remove':
                     continue
@@ -368,7 +416,7 @@ def register_classes():
         MODULES.append(module)
 
 
-def load_modules(database_name, pool, update=None, lang=None):
+def load_modules(database_name, pool, update=None, lang=None, force=False):
     res = True
 
     def _load_modules():
@@ -395,7 +443,7 @@ def load_modules(database_name, pool, update=None, lang=None):
                 module_list += update
             graph = create_graph(module_list)[0]
 
-            load_module_graph(graph, pool, update, lang)
+            load_module_graph(graph, pool, update, lang, force=force)
 
             if update:
                 cursor.execute(*ir_module.select(ir_module.name,
@@ -411,6 +459,9 @@ def load_modules(database_name, pool, update=None, lang=None):
                         for rmod, rid in cursor.fetchall():
                             Model = pool.get(rmod)
                             Model.delete([Model(rid)])
+                        ModuleFile = pool.get('ir.module.file')
+                        if TableHandler.table_exist(ModuleFile._table):
+                            ModuleFile.clean(mod_name)
                         Transaction().connection.commit()
                     cursor.execute(*ir_module.update([ir_module.state],
                             ['uninstalled'],
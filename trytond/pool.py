@@ -50,6 +50,7 @@ class Pool(object):
     _lock = RLock()
     _locks = {}
     _pool = {}
+    _references = {}
     test = False
     _instances = {}
 
@@ -111,6 +112,7 @@ class Pool(object):
         with lock:
             if database_name in cls._pool:
                 del cls._pool[database_name]
+            cls._references.pop(database_name, None)
 
     @classmethod
     def database_list(cls):
@@ -133,11 +135,12 @@ class Pool(object):
         '''
         return self._locks[self.database_name]
 
-    def init(self, update=None, lang=None):
+    def init(self, update=None, lang=None, force=False):
         '''
         Init pool
         Set update to proceed to update
         lang is a list of language code to be updated
+        force reloads all the files of the updated modules
         '''
         with self._lock:
             if not self._started:
@@ -152,7 +155,7 @@ class Pool(object):
             for type in self.classes.keys():
                 self._pool[self.database_name][type] = {}
             restart = not load_modules(self.database_name, self, update=update,
-                    lang=lang)
+                    lang=lang, force=force)
             if restart:
                 self.init()
 
@@ -227,6 +230,30 @@ class Pool(object):
                 cls.__setup__()
             for cls in lst:
                 cls.__post_setup__()
+        self.setup_references()
+
+    def setup_references(self):
+        '''
+        Build the index of the Many2One fields per target model
+        '''
+        from trytond.model import ModelStorage, fields
+        references = {}
+        for model_name, model in self.iterobject():
+            if not issubclass(model, ModelStorage):
+                continue
+            for field_name, field in model._fields.iteritems():
+                if isinstance(field, fields.Many2One):
+                    references.setdefault(field.model_name, []).append(
+                        (model_name, field_name))
+        with self._locks[self.database_name]:
+            self._references[self.database_name] = references
+
+    def get_references(self, name):
+        '''
+        Return the list of (model name, field name) of the Many2One fields
+        which target the model name
+        '''
+        return self._references[self.database_name].get(name, [])
 
 
 def isregisteredby(obj, module, type_='model'):
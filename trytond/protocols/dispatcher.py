@@ -5,6 +5,7 @@ import logging
 import time
 import pydoc
 from functools import wraps
+from contextlib import contextmanager
 
 from werkzeug.utils import redirect
 from sql import Table
@@ -82,6 +83,8 @@ def logout(request, database_name):
     auth = request.authorization
     name = security.logout(
         database_name, auth.get('userid'), auth.get('session'))
+    with Transaction().start(database_name, 0):
+        Cache.resets(database_name)
     logger.info('logout \'%s\' from %s using %s on database \'%s\'',
         name, request.remote_addr, request.scheme, database_name)
     return True
@@ -187,11 +190,15 @@ def _dispatch(request, pool, *args, **kwargs):
     logger.info(log_message, *log_args)
 
     user = request.user_id
+    # The check of the session has already cleaned the caches
+    cleaned = request.authorization.type == 'session'
 
     for count in range(config.getint('database', 'retry'), -1, -1):
-        with Transaction().start(pool.database_name, user,
+        with _start_transaction(request, pool.database_name, user,
                 readonly=rpc.readonly) as transaction:
-            Cache.clean(pool.database_name)
+            if not cleaned:
+                Cache.clean(pool.database_name)
+            cleaned = False
             try:
                 c_args, c_kwargs, transaction.context, transaction.timestamp \
                     = rpc.convert(obj, *args, **kwargs)
@@ -233,6 +240,37 @@ def _dispatch(request, pool, *args, **kwargs):
         return result
 
 
+@contextmanager
+def _start_transaction(request, database_name, user, readonly=False):
+    '''
+    Start the transaction of the request.
+    The readonly calls of a batch share the same transaction which is
+    closed at the end of the batch.
+    '''
+    batch_request = getattr(request, 'batch_request', None)
+    if not readonly or batch_request is None:
+        with Transaction().start(database_name, user,
+                readonly=readonly) as transaction:
+            yield transaction
+        return
+    key = (database_name, user)
+    transaction = batch_request.batch_transactions.get(key)
+    if transaction is None:
+        transaction = Transaction(new=True).start(database_name, user,
+            readonly=True)
+        batch_request.batch_transactions[key] = transaction
+    else:
+        transaction.set_current_transaction(transaction)
+    try:
+        yield transaction
+    except Exception:
+        transaction.rollback()
+        raise
+    finally:
+        current_transaction = transaction._local.transactions.pop()
+        assert current_transaction is transaction
+
+
 def create(request, database_name, password, lang, admin_password):
     '''
     Create a database
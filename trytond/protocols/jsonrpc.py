@@ -9,6 +9,7 @@ try:
 except ImportError:
     import json
 import base64
+from itertools import izip
 
 from werkzeug.wrappers import Response
 from werkzeug.utils import cached_property
@@ -138,6 +139,48 @@ class JSONRequest(Request):
     def params(self):
         return self.parsed_data['params']
 
+    @cached_property
+    def batch(self):
+        "The requests of a batch call or None"
+        try:
+            data = self.parsed_data
+        except BadRequest:
+            return
+        if (isinstance(data, list) and data
+                and all(isinstance(d, dict) for d in data)):
+            return [JSONBatchRequest(self, d) for d in data]
+
+    @cached_property
+    def batch_transactions(self):
+        "The readonly transactions shared by the calls of the batch"
+        return {}
+
+
+class JSONBatchRequest(JSONRequest):
+    "A call of a batch request"
+
+    def __init__(self, batch_request, data):
+        super(JSONBatchRequest, self).__init__(batch_request.environ,
+            populate_request=False, shallow=True)
+        self.batch_request = batch_request
+        self._data = data
+
+    @property
+    def parsed_data(self):
+        return self._data
+
+    @property
+    def batch(self):
+        return
+
+    @property
+    def authorization(self):
+        return self.batch_request.authorization
+
+    @property
+    def user_id(self):
+        return self.batch_request.user_id
+
 
 class JSONProtocol:
     content_type = 'json'
@@ -148,19 +191,34 @@ class JSONProtocol:
 
     @classmethod
     def response(cls, data, request):
+        if request.batch is not None:
+            response = [cls._response(d, r)
+                for d, r in izip(data, request.batch)]
+        else:
+            response = cls._response(data, request)
+        return Response(json.dumps(response, cls=JSONEncoder),
+            content_type='application/json')
+
+    @classmethod
+    def _response(cls, data, request):
         if isinstance(request, JSONRequest):
             response = {'id': request.parsed_data.get('id', 0)}
         else:
             response = {}
-        if isinstance(data, TrytonException):
+        if isinstance(data, Response):
+            # Returned by an error handler for a call of a batch
+            response['error'] = (data.status, data.get_data(as_text=True))
+        elif isinstance(data, TrytonException):
             response['error'] = data.args
         elif isinstance(data, Exception):
-            tb_s = ''.join(traceback.format_exception(*sys.exc_info()))
+            exc_type, exc_value, tb = sys.exc_info()
+            if exc_value is not data:
+                tb = None
+            tb_s = ''.join(traceback.format_exception(type(data), data, tb))
             for path in sys.path:
                 tb_s = tb_s.replace(path, '')
             # report exception back to server
             response['error'] = (str(data), tb_s)
         else:
             response['result'] = data
-        return Response(json.dumps(response, cls=JSONEncoder),
-            content_type='application/json')
+        return response
@@ -37,6 +37,10 @@ class Request(_Request):
     def params(self):
         return
 
+    @property
+    def batch(self):
+        return
+
     @cached_property
     def authorization(self):
         authorization = super(Request, self).authorization
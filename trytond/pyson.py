@@ -7,6 +7,8 @@ except ImportError:
 import datetime
 from dateutil.relativedelta import relativedelta
 from functools import reduce, wraps
+from collections import OrderedDict
+from threading import Lock
 
 
 def reduced_type(types):
@@ -143,6 +145,59 @@ class PYSONDecoder(json.JSONDecoder):
         return dct
 
 
+_evaluators = OrderedDict()
+_evaluators_lock = Lock()
+_EVALUATORS_MAX = 1024
+
+
+def evaluator(pyson):
+    '''
+    Return a function which evaluates the PYSON string with a context.
+    It returns the same value as PYSONDecoder(context).decode(pyson)
+    but the string is parsed only once.
+    '''
+    with _evaluators_lock:
+        evaluate = _evaluators.get(pyson)
+    if evaluate is not None:
+        return evaluate
+    compiled = _compile(json.JSONDecoder().decode(pyson))
+
+    def evaluate(context=None):
+        return compiled(context or {})
+    with _evaluators_lock:
+        _evaluators[pyson] = evaluate
+        while len(_evaluators) > _EVALUATORS_MAX:
+            _evaluators.popitem(last=False)
+    return evaluate
+
+
+def _compile(value):
+    "Return a function of the context computing the decoded value"
+    if isinstance(value, dict):
+        items = [(k, _compile(v)) for k, v in value.iteritems()]
+        klass = value.get('__class__')
+        if isinstance(klass, basestring):
+            klass = CONTEXT.get(klass)
+            if klass:
+                return lambda context: klass.eval(
+                    dict((k, f(context)) for k, f in items), context)
+            return lambda context: dict((k, f(context)) for k, f in items)
+
+        def evaluate(context):
+            dct = dict((k, f(context)) for k, f in items)
+            if '__class__' in dct:
+                klass = CONTEXT.get(dct['__class__'])
+                if klass:
+                    return klass.eval(dct, context)
+            return dct
+        return evaluate
+    elif isinstance(value, list):
+        functions = [_compile(v) for v in value]
+        return lambda context: [f(context) for f in functions]
+    else:
+        return lambda context: value
+
+
 class Eval(PYSON):
 
     def __init__(self, v, d=''):
@@ -8,6 +8,7 @@ except ImportError:
 from trytond.pool import Pool
 from trytond.config import config
 from trytond.transaction import Transaction
+from trytond.cache import Cache
 from trytond import backend
 
 
@@ -63,6 +64,9 @@ def check(dbname, user, session):
             pool = _get_pool(dbname)
             Session = pool.get('ir.session')
             try:
+                # Apply the logouts of other processes before trusting the
+                # cache of the sessions
+                Cache.clean(dbname)
                 if not Session.check(user, session):
                     return
                 else:
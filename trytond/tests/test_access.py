@@ -778,10 +778,134 @@ class ModelFieldAccessTestCase(unittest.TestCase):
                 })
 
 
+class ModelRuleTestCase(unittest.TestCase):
+    'Test Model Rule'
+
+    @classmethod
+    def setUpClass(cls):
+        install_module('tests')
+
+    @with_transaction(context=_context)
+    def test_rule(self):
+        'Test rule domain'
+        pool = Pool()
+        TestAccess = pool.get('test.access')
+        Model = pool.get('ir.model')
+        RuleGroup = pool.get('ir.rule.group')
+
+        model, = Model.search([('model', '=', 'test.access')])
+        test1, test2 = TestAccess.create([
+                {'field1': 'foo'},
+                {'field1': 'bar'},
+                ])
+        RuleGroup.create([{
+                    'name': 'Field1 foo',
+                    'model': model.id,
+                    'global_p': True,
+                    'perm_read': True,
+                    'perm_write': True,
+                    'perm_delete': True,
+                    'rules': [('create', [{
+                                    'domain': '[["field1", "=", "foo"]]',
+                                    }])],
+                    }])
+
+        self.assertEqual(TestAccess.search([]), [test1])
+        self.assertEqual(TestAccess.search([]), [test1])
+        TestAccess.read([test1.id], ['field1'])
+        self.assertRaises(UserError, TestAccess.read, [test2.id], ['field1'])
+        TestAccess.write([test1], {'field2': 'spam'})
+        self.assertRaises(UserError, TestAccess.write, [test2],
+            {'field2': 'spam'})
+        self.assertRaises(UserError, TestAccess.delete, [test2])
+        TestAccess.delete([test1])
+
+    @with_transaction(context=_context)
+    def test_rule_query_cache(self):
+        'Test rule query is cached only for plain domain'
+        pool = Pool()
+        Rule = pool.get('ir.rule')
+        TestAccess = pool.get('test.access')
+        Model = pool.get('ir.model')
+        RuleGroup = pool.get('ir.rule.group')
+
+        model, = Model.search([('model', '=', 'test.access')])
+        rule_group, = RuleGroup.create([{
+                    'name': 'Field1 foo',
+                    'model': model.id,
+                    'global_p': True,
+                    'perm_read': True,
+                    'rules': [('create', [{
+                                    'domain': '[["field1", "=", "foo"]]',
+                                    }])],
+                    }])
+
+        query = Rule.query_get('test.access')
+        self.assertIs(Rule.query_get('test.access'), query)
+        TestAccess.create([{'field1': 'foo'}])
+        self.assertIs(Rule.query_get('test.access'), query)
+
+        RuleGroup.write([rule_group], {
+                'rules': [('create', [{
+                                'domain': '[["create_uid", "=", 0]]',
+                                }])],
+                })
+        query = Rule.query_get('test.access')
+        self.assertIsNot(Rule.query_get('test.access'), query)
+
+    @with_transaction()
+    def test_domain_plain(self):
+        'Test domain with only plain column comparisons'
+        pool = Pool()
+        Rule = pool.get('ir.rule')
+        User = pool.get('res.user')
+
+        for domain, result in [
+                ([], True),
+                ([['login', '=', 'foo']], True),
+                (['OR', [['login', '=', 'foo']], [('id', 'in', [1])]], True),
+                ([['login', 'where', 'foo']], False),
+                ([['menu', '=', 1]], False),
+                ([['menu.name', '=', 'foo']], False),
+                (['AND', ['OR', [('groups', 'in', [1])]]], False),
+                ([['rec_name', '=', 'foo']], False),
+                ([['unknown', '=', 'foo']], False),
+                ]:
+            self.assertEqual(Rule._domain_plain(User, domain), result)
+
+    @with_transaction(context=_context)
+    def test_rule_singleton(self):
+        'Test rule on singleton'
+        pool = Pool()
+        Singleton = pool.get('test.singleton')
+        Model = pool.get('ir.model')
+        RuleGroup = pool.get('ir.rule.group')
+
+        model, = Model.search([('model', '=', 'test.singleton')])
+        RuleGroup.create([{
+                    'name': 'Name test',
+                    'model': model.id,
+                    'global_p': True,
+                    'perm_read': True,
+                    'perm_write': True,
+                    'rules': [('create', [{
+                                    'domain': '[["name", "=", "test"]]',
+                                    }])],
+                    }])
+
+        singleton, = Singleton.search([])
+        Singleton.write([singleton], {'name': 'test'})
+        self.assertEqual(Singleton.read([singleton.id], ['name'])[0]['name'],
+            'test')
+        self.assertEqual(Singleton.search([]), [singleton])
+
+
 def suite():
     suite_ = unittest.TestSuite()
     suite_.addTests(unittest.TestLoader(
         ).loadTestsFromTestCase(ModelAccessTestCase))
     suite_.addTests(unittest.TestLoader(
         ).loadTestsFromTestCase(ModelFieldAccessTestCase))
+    suite_.addTests(unittest.TestLoader(
+        ).loadTestsFromTestCase(ModelRuleTestCase))
     return suite_
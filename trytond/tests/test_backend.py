@@ -0,0 +1,181 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import unittest
+from mock import patch, Mock
+
+try:
+    from psycopg2.pool import PoolError
+    from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+    from trytond.backend.postgresql.database import ConnectionPool, \
+        ReplicaPool, Database
+except ImportError:
+    ConnectionPool = None
+
+from trytond.config import config
+
+
+@unittest.skipIf(ConnectionPool is None, 'requires psycopg2')
+class ConnectionPoolTestCase(unittest.TestCase):
+    'Test PostgreSQL connection pool'
+
+    def setUp(self):
+        patcher = patch('trytond.backend.postgresql.database.connect',
+            side_effect=self.connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    lag = 0
+
+    def connect(self, dsn):
+        connection = Mock()
+        connection.dsn = dsn
+        connection.closed = False
+        connection.server_version = 90600
+        connection.cursor.return_value.fetchone.return_value = (self.lag,)
+        connection.get_transaction_status.return_value = \
+            TRANSACTION_STATUS_IDLE
+
+        def close():
+            connection.closed = True
+        connection.close.side_effect = close
+        return connection
+
+    def test_stats(self):
+        'Test stats'
+        pool = ConnectionPool('test', 1, 3, 'dbname=test')
+        conn1 = pool.getconn()
+        conn2 = pool.getconn()
+        pool.record_wait(0.5, True)
+        self.assertEqual(pool.stats(), {
+                'size': 2,
+                'in_use': 2,
+                'idle': 0,
+                'high_water': 2,
+                'checkouts': 2,
+                'waits': 1,
+                'wait_time': 0.5,
+                'max_wait_time': 0.5,
+                })
+        pool.putconn(conn1)
+        pool.putconn(conn2)
+        stats = pool.stats()
+        self.assertEqual(stats['in_use'], 0)
+        self.assertEqual(stats['idle'], 2)
+        self.assertEqual(stats['high_water'], 2)
+
+    def test_exhausted(self):
+        'Test exhausted pool'
+        pool = ConnectionPool('test', 0, 1, 'dbname=test')
+        conn = pool.getconn()
+        self.assertRaises(PoolError, pool.getconn)
+        pool.putconn(conn)
+        self.assertIs(pool.getconn(), conn)
+
+    def test_trim(self):
+        'Test trim idle connections'
+        pool = ConnectionPool('test', 1, 3, 'dbname=test', idle_timeout=60)
+        connections = [pool.getconn() for _ in range(3)]
+        for conn in connections:
+            pool.putconn(conn)
+        self.assertEqual(pool.trim(), 0)
+        with patch('time.time', return_value=pool._last_trim + 120):
+            self.assertEqual(pool.trim(), 2)
+        self.assertEqual(pool.stats()['idle'], 1)
+        self.assertEqual(sum(c.closed for c in connections), 2)
+
+    def test_put_close(self):
+        'Test put connection with close'
+        pool = ConnectionPool('test', 1, 3, 'dbname=test')
+        conn = pool.getconn()
+        pool.putconn(conn, close=True)
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_replica_available(self):
+        'Test replica available'
+        pool = ReplicaPool('test', 0, 3, 'dbname=test', max_lag=30)
+        self.assertTrue(pool.available)
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_replica_exhausted(self):
+        'Test replica with exhausted pool is available'
+        pool = ReplicaPool('test', 0, 1, 'dbname=test')
+        pool.getconn()
+        self.assertTrue(pool.available)
+
+    def test_replica_lag(self):
+        'Test replica with too much lag'
+        self.lag = 60
+        pool = ReplicaPool('test', 0, 3, 'dbname=test', max_lag=30)
+        self.assertFalse(pool.available)
+
+    def test_replica_check_interval(self):
+        'Test replica checked once per interval'
+        pool = ReplicaPool('test', 0, 3, 'dbname=test', check_interval=10)
+        with patch.object(pool, 'check', return_value=True) as check:
+            self.assertTrue(pool.available)
+            self.assertTrue(pool.available)
+            self.assertEqual(check.call_count, 1)
+
+    def replica_database(self):
+        uri = config.get('database', 'uri')
+        config.set('database', 'uri', 'postgresql://primary/')
+        self.addCleanup(config.set, 'database', 'uri', uri)
+        config.set('database', 'replicas', 'postgresql://standby/')
+        self.addCleanup(config.remove_option, 'database', 'replicas')
+        database = Database('test_replica').connect()
+        self.addCleanup(Database._databases.pop, 'test_replica')
+        self.addCleanup(database.close)
+        return database
+
+    def test_replica_routing(self):
+        'Test readonly connection routed to replica'
+        database = self.replica_database()
+
+        conn = database.get_connection(readonly=True)
+        self.assertIn('host=standby', conn.dsn)
+        database.put_connection(conn)
+        self.assertEqual(database._replicas[0].stats()['in_use'], 0)
+
+        conn = database.get_connection()
+        self.assertIn('host=primary', conn.dsn)
+        database.put_connection(conn)
+
+        database._replicas[0]._available = False
+        database._replicas[0]._checked = float('inf')
+        conn = database.get_connection(readonly=True)
+        self.assertIn('host=primary', conn.dsn)
+        database.put_connection(conn)
+
+    def test_replica_use_primary(self):
+        'Test readonly connection on primary after use_primary'
+        database = self.replica_database()
+        stale = database.get_connection(readonly=True)
+        self.assertFalse(database.is_stale(stale))
+
+        database.use_primary()
+        self.assertTrue(database.is_stale(stale))
+        conn = database.get_connection(readonly=True)
+        self.assertIn('host=primary', conn.dsn)
+        self.assertFalse(database.is_stale(conn))
+        database.put_connection(conn)
+        database.put_connection(stale)
+
+        database._primary_until = 0
+        conn = database.get_connection(readonly=True)
+        self.assertIn('host=standby', conn.dsn)
+        self.assertFalse(database.is_stale(conn))
+        database.put_connection(conn)
+
+    def test_replica_stats(self):
+        'Test stats with replicas'
+        database = self.replica_database()
+        stats = database.stats()
+        self.assertEqual(stats['replicas'].keys(), ['test_replica on standby'])
+        self.assertEqual(stats['replicas']['test_replica on standby']['size'],
+            0)
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(
+        ConnectionPoolTestCase)
@@ -1,14 +1,26 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
 
+import os
 import unittest
 
-from trytond.cache import freeze
+from mock import patch
+
+from trytond.config import config
+from trytond.cache import freeze, Cache, MemoryCache, SharedCache, \
+    _SharedManager, _SharedStore, _shared_authkey, pickle
+from trytond.tests.test_tryton import install_module, with_transaction, \
+    DB_NAME
+from trytond.transaction import Transaction
 
 
 class CacheTestCase(unittest.TestCase):
     "Test Cache"
 
+    @classmethod
+    def setUpClass(cls):
+        install_module('tests')
+
     def testFreeze(self):
         "Test freeze"
         self.assertEqual(freeze([1, 2, 3]), (1, 2, 3))
@@ -31,6 +43,203 @@ class CacheTestCase(unittest.TestCase):
                                             ('string', 'test'),
                                             ]))]))]))
 
+    @with_transaction()
+    def test_listening_without_channel(self):
+        "Test listening without channel"
+        database = Transaction().database
+        with patch.object(database, 'has_channel', return_value=False):
+            self.assertFalse(Cache._listening(DB_NAME))
+        self.assertNotIn((os.getpid(), DB_NAME), Cache._listener)
+
+    @with_transaction()
+    def test_listening_with_listener(self):
+        "Test listening with a running listener"
+        database = Transaction().database
+        key = (os.getpid(), DB_NAME)
+        with patch.object(database, 'has_channel', return_value=True), \
+                patch.dict(Cache._listener, {key: object()}), \
+                patch.object(Transaction, 'new_transaction') as new:
+            self.assertTrue(Cache._listening(DB_NAME))
+            Cache.clean(DB_NAME)
+            self.assertFalse(new.called)
+
+    @with_transaction()
+    def test_memory_cache(self):
+        "Test memory cache"
+        cache = MemoryCache('test.cache.memory', size_limit=2)
+
+        cache.set('foo', 1)
+        cache.set('bar', 2)
+        self.assertEqual(cache.get('foo'), 1)
+        cache.set('baz', 3)
+        self.assertEqual(cache.get('bar'), None)
+        self.assertEqual(cache.get('foo'), 1)
+
+        cache._clear(DB_NAME, 2)
+        self.assertEqual(cache.get('foo'), None)
+        cache.set('foo', 1)
+        cache._clear(DB_NAME, 1)
+        self.assertEqual(cache.get('foo'), 1)
+
+        Cache._cache_instance.remove(cache)
+
+    @with_transaction()
+    def test_shared_cache_local(self):
+        "Test shared cache keeps values in memory"
+        cache = SharedCache('test.cache.shared')
+        store = _SharedStore()
+
+        with patch.object(SharedCache, '_store', return_value=store), \
+                patch.object(store, 'get', wraps=store.get) as get:
+            cache.set('foo', 1)
+            self.assertEqual(cache.get('foo'), 1)
+            self.assertEqual(cache.get('foo'), 1)
+            self.assertFalse(get.called)
+
+            cache._cache.clear()
+            self.assertEqual(cache.get('foo'), 1)
+            self.assertEqual(cache.get('foo'), 1)
+            self.assertEqual(get.call_count, 1)
+
+        Cache._cache_instance.remove(cache)
+
+    @with_transaction()
+    def test_shared_cache_local_size_limit(self):
+        "Test shared cache keeps only a few values in memory"
+        cache = SharedCache('test.cache.shared')
+        store = _SharedStore()
+
+        with patch.object(SharedCache, '_store', return_value=store), \
+                patch.object(SharedCache, 'local_size_limit', 2), \
+                patch.object(store, 'get', wraps=store.get) as get:
+            for i in range(3):
+                cache.set(i, i)
+            self.assertEqual(len(cache._cache[DB_NAME]), 2)
+            self.assertEqual(cache.get(0), 0)
+            self.assertEqual(get.call_count, 1)
+
+        Cache._cache_instance.remove(cache)
+
+    def test_shared_cache_authkey(self):
+        "Test shared cache requires an authkey"
+        self.assertFalse(config.has_option('cache', 'authkey'))
+        self.assertRaises(ValueError, _shared_authkey)
+        with patch.dict(config._sections.setdefault('cache', {}),
+                {'authkey': 'secret'}):
+            self.assertEqual(_shared_authkey(), 'secret')
+
+    def test_shared_cache_socket_mode(self):
+        "Test shared cache socket is created only for the user"
+        masks = []
+
+        def get_server(manager):
+            mask = os.umask(0)
+            os.umask(mask)
+            masks.append(mask)
+            raise StopIteration
+
+        with patch.dict(config._sections.setdefault('cache', {}),
+                    {'authkey': 'secret', 'socket': '/nonexistent'}), \
+                patch.object(_SharedManager, 'get_server', get_server):
+            self.assertRaises(StopIteration, SharedCache.serve)
+        self.assertEqual(masks, [0o177])
+
+    @with_transaction()
+    def test_shared_cache_unavailable(self):
+        "Test shared cache waits before connecting again"
+        cache = SharedCache('test.cache.shared')
+
+        with patch.dict(SharedCache._stores, clear=True), \
+                patch.dict(SharedCache._retries, clear=True), \
+                patch('trytond.cache._shared_authkey',
+                    return_value='secret'), \
+                patch.object(_SharedManager, 'connect',
+                    side_effect=IOError) as connect, \
+                patch('trytond.cache.logger') as logger:
+            self.assertEqual(cache.get('foo'), None)
+            self.assertEqual(cache.get('foo'), None)
+            cache.set('foo', 1)
+            self.assertEqual(connect.call_count, 1)
+            self.assertEqual(logger.warning.call_count, 1)
+            self.assertEqual(cache.get('foo'), 1)
+
+        Cache._cache_instance.remove(cache)
+
+    @with_transaction()
+    def test_shared_cache_unpicklable(self):
+        "Test shared cache logs once values which can not be pickled"
+        cache = SharedCache('test.cache.shared')
+        store = _SharedStore()
+
+        with patch.object(SharedCache, '_store', return_value=store), \
+                patch.object(store, 'set',
+                    side_effect=pickle.PicklingError), \
+                patch.object(SharedCache, '_unpicklable', set()), \
+                patch('trytond.cache.logger') as logger:
+            cache.set('foo', 1)
+            cache.set('bar', 2)
+            self.assertEqual(logger.warning.call_count, 1)
+            self.assertEqual(cache.get('foo'), 1)
+            self.assertEqual(cache.get('bar'), 2)
+
+        Cache._cache_instance.remove(cache)
+
+    @with_transaction()
+    def test_memory_cache_stale(self):
+        "Test memory cache does not store values of stale transaction"
+        cache = MemoryCache('test.cache.memory')
+        database = Transaction().database
+
+        with patch.object(database, 'is_stale', return_value=True):
+            self.assertEqual(cache.set('foo', 1), 1)
+        self.assertEqual(cache.get('foo'), None)
+
+        with patch.object(database, 'use_primary') as use_primary:
+            cache.clear()
+            use_primary.assert_called_once_with()
+
+        Cache._cache_instance.remove(cache)
+
+    def test_shared_store_lru(self):
+        "Test shared store with LRU eviction"
+        store = _SharedStore(eviction='lru')
+
+        store.set('db', 'test', 'foo', 1, 2)
+        store.set('db', 'test', 'bar', 2, 2)
+        self.assertEqual(store.get('db', 'test', 'foo'), (True, 1))
+        store.set('db', 'test', 'baz', 3, 2)
+        self.assertEqual(store.get('db', 'test', 'bar'), (False, None))
+        self.assertEqual(store.get('db', 'test', 'foo'), (True, 1))
+        self.assertEqual(store.get('other', 'test', 'foo'), (False, None))
+
+    def test_shared_store_fifo(self):
+        "Test shared store with FIFO eviction"
+        store = _SharedStore(eviction='fifo')
+
+        store.set('db', 'test', 'foo', 1, 2)
+        store.set('db', 'test', 'bar', 2, 2)
+        self.assertEqual(store.get('db', 'test', 'foo'), (True, 1))
+        store.set('db', 'test', 'baz', 3, 2)
+        self.assertEqual(store.get('db', 'test', 'foo'), (False, None))
+        self.assertEqual(store.get('db', 'test', 'bar'), (True, 2))
+
+    def test_shared_store_clear(self):
+        "Test shared store clear"
+        store = _SharedStore()
+
+        store.set('db', 'test', 'foo', 1, 10)
+        store.clear('db', 'test', 2)
+        self.assertEqual(store.get('db', 'test', 'foo'), (False, None))
+
+        store.set('db', 'test', 'foo', 1, 10)
+        store.clear('db', 'test', 1)
+        self.assertEqual(store.get('db', 'test', 'foo'), (True, 1))
+
+        store.set('other', 'test', 'foo', 1, 10)
+        store.drop('db')
+        self.assertEqual(store.get('db', 'test', 'foo'), (False, None))
+        self.assertEqual(store.get('other', 'test', 'foo'), (True, 1))
+
 
 def suite():
     func = unittest.TestLoader().loadTestsFromTestCase
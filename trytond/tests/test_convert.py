@@ -0,0 +1,101 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import unittest
+from io import BytesIO
+from mock import patch
+
+from trytond.convert import TrytondXmlHandler
+from trytond.pool import Pool
+from trytond.tests.test_tryton import install_module, with_transaction
+
+XML = b'''<?xml version="1.0"?>
+<tryton>
+    <data>
+        <record model="ir.ui.view" id="view_test_tree">
+            <field name="model">ir.lang</field>
+            <field name="type">tree</field>
+            <field name="name">lang_list</field>
+        </record>
+        <record model="ir.action.act_window" id="act_test">
+            <field name="name">Test Action</field>
+            <field name="res_model">ir.lang</field>
+        </record>
+        <record model="ir.action.act_window.view" id="act_test_view">
+            <field name="sequence" eval="10"/>
+            <field name="view" ref="view_test_tree"/>
+            <field name="act_window" ref="act_test"/>
+        </record>
+        <menuitem id="menu_test_parent" name="Test Parent"/>
+        <menuitem id="menu_test" parent="menu_test_parent"
+            action="act_test"/>
+        <menuitem id="menu_test_icon" parent="menu_test_parent"
+            action="act_test" name="Test Icon" icon="tryton-new"/>
+        <menuitem id="menu_test_child" parent="menu_test"
+            name="Test Child"/>
+    </data>
+</tryton>'''
+
+
+class ConvertTestCase(unittest.TestCase):
+    'Test XML conversion'
+
+    @classmethod
+    def setUpClass(cls):
+        install_module('tests')
+
+    def parse(self, xml):
+        parser = TrytondXmlHandler(
+            pool=Pool(), module='tests', module_state='to upgrade')
+        parser.parse_xmlstream(BytesIO(xml))
+        return parser
+
+    @with_transaction()
+    def test_menuitem(self):
+        'Test menuitem values from action'
+        pool = Pool()
+        Menu = pool.get('ir.ui.menu')
+        ModelData = pool.get('ir.model.data')
+
+        self.parse(XML)
+
+        def get(fs_id):
+            return Menu(ModelData.get_id('tests', fs_id))
+        parent = get('menu_test_parent')
+        menu = get('menu_test')
+        self.assertEqual(menu.name, 'Test Action')
+        self.assertEqual(menu.icon, 'tryton-list')
+        self.assertEqual(menu.parent, parent)
+        self.assertEqual(menu.action.name, 'Test Action')
+        menu_icon = get('menu_test_icon')
+        self.assertEqual(menu_icon.name, 'Test Icon')
+        self.assertEqual(menu_icon.icon, 'tryton-new')
+        self.assertEqual(get('menu_test_child').parent, menu)
+
+    @with_transaction()
+    def test_batch(self):
+        'Test records are created in batch'
+        pool = Pool()
+        Menu = pool.get('ir.ui.menu')
+
+        with patch.object(Menu, 'create', wraps=Menu.create) as create:
+            self.parse(XML)
+        # The pending menus are created when referenced as parent
+        self.assertEqual(
+            [len(c[0][0]) for c in create.call_args_list], [1, 2, 1])
+
+    @with_transaction()
+    def test_update(self):
+        'Test update of unchanged records does not write'
+        pool = Pool()
+        Menu = pool.get('ir.ui.menu')
+
+        self.parse(XML)
+        with patch.object(Menu, 'create') as create, \
+                patch.object(Menu, 'write') as write:
+            self.parse(XML)
+            self.assertFalse(create.called)
+            self.assertFalse(write.called)
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(ConvertTestCase)
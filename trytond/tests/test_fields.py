@@ -12,6 +12,9 @@ except ImportError:
 import unittest
 import datetime
 from decimal import Decimal
+
+from mock import patch
+
 from trytond.tests.test_tryton import install_module, with_transaction
 from trytond.transaction import Transaction
 from trytond.exceptions import UserError
@@ -2723,6 +2726,32 @@ class FieldsTestCase(unittest.TestCase):
                 [('parents', 'not parent_of', clause)])
             self.assertEqual(result, not_(test))
 
+    @with_transaction()
+    def test_reference_read_related(self):
+        'Test read related fields of Reference'
+        pool = Pool()
+        Reference = pool.get('test.reference')
+        ReferenceTarget = pool.get('test.reference.target')
+
+        targets = ReferenceTarget.create([{
+                    'name': 'target%s' % i,
+                    } for i in range(3)])
+        references = Reference.create([{
+                    'name': 'reference%s' % i,
+                    'reference': str(target),
+                    } for i, target in enumerate(targets * 2)] + [{
+                    'name': 'empty',
+                    'reference': None,
+                    }])
+
+        with patch.object(ReferenceTarget, 'read',
+                wraps=ReferenceTarget.read) as read:
+            result = Reference.read([r.id for r in references],
+                ['reference.name'])
+            self.assertEqual(read.call_count, 1)
+        self.assertEqual([r['reference.name'] for r in result],
+            [t.name for t in targets * 2] + [None])
+
     @with_transaction()
     def test_reference(self):
         'Test Reference'
@@ -3,6 +3,8 @@
 import unittest
 import datetime
 
+from mock import patch
+
 from trytond.tests.test_tryton import install_module, with_transaction
 from trytond.transaction import Transaction
 from trytond.pool import Pool
@@ -213,6 +215,82 @@ class HistoryTestCase(unittest.TestCase):
         history = History(history_id)
         self.assertEqual(history.value, 1)
 
+    def _test_restore_history_batch(self):
+        pool = Pool()
+        History = pool.get('test.history')
+        transaction = Transaction()
+        database = transaction.database
+        size = database.IN_MAX + 10
+
+        records = History.create([{'value': i} for i in range(size)])
+        ids = [r.id for r in records]
+        first = records[-1].create_date
+
+        transaction.commit()
+
+        History.write(list(History.browse(ids[::2])), {'value': -1})
+        History.delete(list(History.browse(ids[1::3])))
+        new, = History.create([{'value': -2}])
+
+        transaction.commit()
+
+        History.restore_history(ids + [new.id], first)
+        self.assertEqual(
+            [r.value for r in History.browse(ids)], range(size))
+        self.assertEqual(History.search([('id', '=', new.id)]), [])
+
+    @with_transaction()
+    def test_restore_history_batch(self):
+        'Test restore history of many records'
+        self._test_restore_history_batch()
+
+    @with_transaction()
+    def test_restore_history_batch_fallback(self):
+        'Test restore history of many records without extended SQL'
+        database = Transaction().database
+        with patch.object(database, 'has_window_functions',
+                    return_value=False), \
+                patch.object(database, 'has_update_from',
+                    return_value=False):
+            self._test_restore_history_batch()
+
+    @unittest.skipUnless(backend.name() == 'sqlite',
+        'Counts the queries executed by the SQLite cursor')
+    @with_transaction()
+    def test_restore_history_benchmark(self):
+        'Test restore history queries do not depend on the number of records'
+        from trytond.backend.sqlite.database import SQLiteCursor
+        pool = Pool()
+        History = pool.get('test.history')
+        transaction = Transaction()
+
+        records = History.create([{'value': 1} for _ in range(100)])
+        ids = [r.id for r in records]
+        first = records[-1].create_date
+
+        transaction.commit()
+
+        History.write(records, {'value': 2})
+        History.delete(records[::2])
+
+        transaction.commit()
+
+        queries = []
+        execute = SQLiteCursor.execute
+
+        def count(self, *args):
+            queries.append(args[0])
+            return execute(self, *args)
+
+        with patch.object(SQLiteCursor, 'execute', count):
+            History.restore_history(ids[:2], first)
+            queries_one = len(queries)
+            del queries[:]
+            History.restore_history(ids, first)
+        self.assertEqual(len(queries), queries_one)
+        self.assertEqual([r.value for r in History.browse(ids)],
+            [1] * len(ids))
+
     @unittest.skipUnless(backend.name() == 'postgresql',
         'CURRENT_TIMESTAMP as transaction_timestamp is specific to postgresql')
     @with_transaction()
@@ -286,6 +364,8 @@ class HistoryTestCase(unittest.TestCase):
             with Transaction().set_context(_datetime=timestamp):
                 records = History.search([], order=order)
                 self.assertEqual(records, instances)
+                records = list(History.search_iter([], order=order))
+                self.assertEqual(records, instances)
             transaction.rollback()
 
         to_delete, _ = History.search([], order=order)
@@ -402,6 +482,33 @@ class HistoryTestCase(unittest.TestCase):
         self.assertEqual(
             [l.name for l in history.lines_at_stamp], ['a', 'b'])
 
+    @with_transaction()
+    def test_read_datetime_field(self):
+        'Test read of datetime_field grouped by datetime'
+        pool = Pool()
+        History = pool.get('test.history')
+        Line = pool.get('test.history.line')
+        transaction = Transaction()
+
+        histories = History.create([{
+                    'value': i,
+                    'lines': [('create', [{'name': str(i)}])],
+                    } for i in range(3)])
+        transaction.commit()
+
+        now = datetime.datetime.now()
+        History.write(histories[:2], {'stamp': datetime.datetime.max})
+        History.write(histories[2:], {'stamp': now})
+
+        field = History._fields['lines_at_stamp']
+        with patch.object(field, 'get', wraps=field.get) as getter:
+            result = History.read([h.id for h in histories],
+                ['lines_at_stamp'])
+            self.assertEqual(getter.call_count, 2)
+        self.assertEqual(
+            [[Line(l).name for l in r['lines_at_stamp']] for r in result],
+            [['0'], ['1'], ['2']])
+
     @with_transaction()
     def test_search_cursor_max(self):
         'Test search with number of history entries at database.IN_MAX'
@@ -1,11 +1,15 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+import datetime
 from dateutil.relativedelta import relativedelta
 import unittest
+from mock import patch
 
+from trytond import backend, security
 from trytond.pool import Pool
 from trytond.transaction import Transaction
-from .test_tryton import ModuleTestCase, with_transaction
+from trytond.cache import Cache
+from .test_tryton import ModuleTestCase, with_transaction, DB_NAME, USER
 
 
 class IrTestCase(ModuleTestCase):
@@ -40,6 +44,299 @@ class IrTestCase(ModuleTestCase):
             self.assertEqual(Sequence.get_id(sequence.id),
                 '%s3' % str(next_year.year))
 
+    @with_transaction()
+    def test_session_check_cache(self):
+        'Test Session check uses the cache'
+        pool = Pool()
+        Session = pool.get('ir.session')
+        user = Transaction().user
+
+        session, = Session.create([{}])
+        self.assertTrue(Session.check(user, session.key))
+        with patch.object(Session, 'search') as search:
+            self.assertTrue(Session.check(user, session.key))
+            self.assertFalse(search.called)
+        self.assertFalse(Session.check(user + 1, session.key))
+
+    @with_transaction()
+    def test_session_reset_coalesce(self):
+        'Test Session reset is coalesced'
+        pool = Pool()
+        Session = pool.get('ir.session')
+
+        session, = Session.create([{}])
+        Session.reset(session.key)
+        with patch.object(Session, 'write') as write:
+            Session.reset(session.key)
+            self.assertFalse(write.called)
+
+    @with_transaction()
+    def test_session_delete_clear_cache(self):
+        'Test Session delete clears the cache'
+        pool = Pool()
+        Session = pool.get('ir.session')
+        user = Transaction().user
+
+        session, = Session.create([{}])
+        key = session.key
+        self.assertTrue(Session.check(user, key))
+        Session.delete([session])
+        self.assertFalse(Session.check(user, key))
+
+    def test_session_check_clean_cache(self):
+        'Test security check applies the resets of other processes'
+        with Transaction().start(DB_NAME, USER) as transaction:
+            pool = Pool()
+            Session = pool.get('ir.session')
+            session, = Session.create([{}])
+            self.assertTrue(Session.check(USER, session.key))
+            transaction.commit()
+
+        def clean(dbname):
+            # Simulate the logout from another process
+            Session._check_cache._clear(dbname)
+        with patch.object(Cache, 'clean', side_effect=clean) as clean_, \
+                patch.object(Session, 'search', return_value=[]) as search:
+            self.assertIsNone(security.check(DB_NAME, USER, session.key))
+            clean_.assert_called_once_with(DB_NAME)
+            self.assertTrue(search.called)
+
+    @with_transaction()
+    def test_session_delete_expired(self):
+        'Test Session deletes expired sessions without clearing the cache'
+        pool = Pool()
+        Session = pool.get('ir.session')
+        user = Transaction().user
+        table = Session.__table__()
+        cursor = Transaction().connection.cursor()
+
+        # The default key is computed once per create call
+        session, = Session.create([{}])
+        other, = Session.create([{}])
+        self.assertTrue(Session.check(user, session.key))
+        expired, = Session.create([{}])
+        cursor.execute(*table.update(
+                [table.create_date],
+                [datetime.datetime.now() - datetime.timedelta(days=1)],
+                where=table.id == expired.id))
+
+        with patch.object(Session._check_cache, 'clear') as clear:
+            self.assertTrue(Session.check(user, other.key))
+            self.assertFalse(clear.called)
+        self.assertEqual(Session.search([('id', '=', expired.id)]), [])
+        with patch.object(Session, 'search') as search:
+            self.assertTrue(Session.check(user, session.key))
+            self.assertFalse(search.called)
+
+    @with_transaction()
+    def test_translation_get_source(self):
+        'Test Translation get_source'
+        pool = Pool()
+        Translation = pool.get('ir.translation')
+
+        Translation.create([{
+                    'lang': 'fr_FR',
+                    'type': 'error',
+                    'name': 'test.error',
+                    'src': 'Error',
+                    'value': 'Erreur',
+                    }])
+
+        self.assertEqual(
+            Translation.get_source('test.error', 'error', 'fr_FR', 'Error'),
+            'Erreur')
+        self.assertEqual(
+            Translation.get_source('test.error', 'error', 'fr_FR'), 'Erreur')
+        self.assertEqual(
+            Translation.get_source('test.error', 'error', 'fr_FR', 'Foo'),
+            None)
+        self.assertEqual(Translation.get_sources([
+                    ('test.error', 'error', 'fr_FR', 'Error'),
+                    ('test.error', 'error', 'de_DE', 'Error'),
+                    ]), {
+                ('test.error', 'error', 'fr_FR', 'Error'): 'Erreur',
+                ('test.error', 'error', 'de_DE', 'Error'): None,
+                })
+
+    @with_transaction()
+    def test_translation_catalog(self):
+        'Test Translation catalog is cleared on modification'
+        pool = Pool()
+        Translation = pool.get('ir.translation')
+
+        catalog = Translation.get_catalog('fr_FR')
+        self.assertIs(Translation.get_catalog('fr_FR'), catalog)
+        with patch.object(Transaction().connection, 'cursor') as cursor:
+            Translation.get_source('test.error', 'error', 'fr_FR')
+            self.assertFalse(cursor.called)
+
+        translation, = Translation.create([{
+                    'lang': 'fr_FR',
+                    'type': 'error',
+                    'name': 'test.error',
+                    'src': 'Error',
+                    'value': 'Erreur',
+                    }])
+        self.assertEqual(
+            Translation.get_source('test.error', 'error', 'fr_FR'), 'Erreur')
+
+        Translation.write([translation], {'value': 'Faute'})
+        self.assertEqual(
+            Translation.get_source('test.error', 'error', 'fr_FR'), 'Faute')
+
+        Translation.delete([translation])
+        self.assertEqual(
+            Translation.get_source('test.error', 'error', 'fr_FR'), None)
+
+    @with_transaction()
+    def test_translation_set_ids(self):
+        'Test Translation set_ids creates and updates in bulk'
+        pool = Pool()
+        Translation = pool.get('ir.translation')
+        Menu = pool.get('ir.ui.menu')
+        Config = pool.get('ir.configuration')
+
+        lang = Config.get_language()
+        menus = Menu.search([], limit=3, order=[('id', 'ASC')])
+        ids = [m.id for m in menus]
+        name = 'ir.ui.menu,name'
+
+        def get_values(lang):
+            translations = Translation.search([
+                    ('lang', '=', lang),
+                    ('name', '=', name),
+                    ('type', '=', 'model'),
+                    ('res_id', 'in', ids),
+                    ])
+            return {t.res_id: (t.value, t.fuzzy) for t in translations}
+
+        Translation.set_ids(name, 'model', 'fr_FR', ids, ['Un', 'Deux', 'Un'])
+        self.assertEqual(get_values('fr_FR'), {
+                ids[0]: ('Un', False),
+                ids[1]: ('Deux', False),
+                ids[2]: ('Un', False),
+                })
+
+        Translation.set_ids(name, 'model', lang, ids, ['A', 'B', 'C'])
+        Translation.set_ids(name, 'model', lang, ids, ['A', 'B', 'C'])
+        self.assertEqual(get_values(lang), {
+                ids[0]: ('A', False),
+                ids[1]: ('B', False),
+                ids[2]: ('C', False),
+                })
+        self.assertTrue(all(f for _, f in get_values('fr_FR').values()))
+
+        Translation.set_ids(name, 'model', 'fr_FR', ids, ['Trois'] * 3)
+        self.assertEqual(get_values('fr_FR'), {
+                i: ('Trois', False) for i in ids})
+
+    @unittest.skipUnless(backend.name() == 'sqlite',
+        'Counts the queries executed by the SQLite cursor')
+    @with_transaction()
+    def test_translation_set_ids_queries(self):
+        'Test Translation set_ids updates with one query'
+        from trytond.backend.sqlite.database import SQLiteCursor
+        pool = Pool()
+        Translation = pool.get('ir.translation')
+        Menu = pool.get('ir.ui.menu')
+        Config = pool.get('ir.configuration')
+
+        lang = Config.get_language()
+        menus = Menu.search([], limit=3, order=[('id', 'ASC')])
+        ids = [m.id for m in menus]
+        sources = [m.name for m in menus]
+        name = 'ir.ui.menu,name'
+        Translation.set_ids(name, 'model', 'fr_FR', ids, ['Un', 'Deux', 'Un'])
+        Translation.set_ids(name, 'model', lang, ids, ['A', 'B', 'C'])
+
+        updates = []
+        execute = SQLiteCursor.execute
+
+        def count(self, query, *args):
+            if query.startswith('UPDATE "ir_translation"'):
+                updates.append(query)
+            return execute(self, query, *args)
+
+        with patch.object(SQLiteCursor, 'execute', count):
+            Translation.set_ids(name, 'model', 'fr_FR', ids,
+                ['Trois', 'Quatre', 'Cinq'])
+            self.assertEqual(len(updates), 1)
+            del updates[:]
+            # The other languages are updated as fuzzy
+            Translation.set_ids(name, 'model', lang, ids, ['D', 'E', 'F'])
+            self.assertEqual(len(updates), 2)
+        translations = Translation.search([
+                ('lang', '=', 'fr_FR'),
+                ('name', '=', name),
+                ('type', '=', 'model'),
+                ('res_id', 'in', ids),
+                ], order=[('res_id', 'ASC')])
+        self.assertEqual(
+            [(t.value, t.src, bool(t.fuzzy)) for t in translations],
+            [('Trois', sources[0], True), ('Quatre', sources[1], True),
+                ('Cinq', sources[2], True)])
+        self.assertEqual([t.src_md5 for t in translations],
+            [Translation.get_src_md5(s) for s in sources])
+
+    @with_transaction()
+    def test_module_file_xml(self):
+        'Test Module File detects changed XML files'
+        pool = Pool()
+        ModuleFile = pool.get('ir.module.file')
+        ModelData = pool.get('ir.model.data')
+        Lang = pool.get('ir.lang')
+        lang = Lang.__table__()
+        cursor = Transaction().connection.cursor()
+
+        module_file, = ModuleFile.search([
+                ('module', '=', 'ir'),
+                ('name', '=', 'lang.xml'),
+                ])
+        fs_ids = ModuleFile.get_xml('ir', 'lang.xml', module_file.digest)
+        self.assertIn(('ir', 'lang_fr'), fs_ids)
+        self.assertIsNone(ModuleFile.get_xml('ir', 'lang.xml', 'changed'))
+
+        lang_id = ModelData.get_id('ir', 'lang_fr')
+        cursor.execute(*lang.update([lang.write_date],
+                [datetime.datetime.now() + datetime.timedelta(days=1)],
+                where=lang.id == lang_id))
+        self.assertIsNone(
+            ModuleFile.get_xml('ir', 'lang.xml', module_file.digest))
+
+    @with_transaction()
+    def test_module_file_po(self):
+        'Test Module File detects changed PO files'
+        pool = Pool()
+        ModuleFile = pool.get('ir.module.file')
+        Translation = pool.get('ir.translation')
+        translation = Translation.__table__()
+        cursor = Transaction().connection.cursor()
+
+        self.assertFalse(ModuleFile.is_po_unchanged(
+                'ir', 'locale/fr_FR.po', 'digest', 'fr_FR'))
+        ModuleFile.set_file('ir', 'locale/fr_FR.po', 'digest')
+        self.assertTrue(ModuleFile.is_po_unchanged(
+                'ir', 'locale/fr_FR.po', 'digest', 'fr_FR'))
+        self.assertFalse(ModuleFile.is_po_unchanged(
+                'ir', 'locale/fr_FR.po', 'changed', 'fr_FR'))
+
+        record, = Translation.create([{
+                    'lang': 'fr_FR',
+                    'module': 'ir',
+                    'type': 'error',
+                    'name': 'test',
+                    'src': 'Test',
+                    'value': 'Test',
+                    }])
+        cursor.execute(*translation.update([translation.create_date],
+                [datetime.datetime.now() + datetime.timedelta(days=1)],
+                where=translation.id == record.id))
+        self.assertFalse(ModuleFile.is_po_unchanged(
+                'ir', 'locale/fr_FR.po', 'digest', 'fr_FR'))
+
+        ModuleFile.clean('ir', [])
+        self.assertFalse(ModuleFile.search([('module', '=', 'ir')]))
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(IrTestCase)
@@ -4,6 +4,7 @@
 
 import unittest
 import time
+import threading
 
 from mock import patch, call
 
@@ -114,6 +115,219 @@ class ModelSQLTestCase(unittest.TestCase):
                     call([records[1]], 'field', 2),
                     ])
 
+    @with_transaction()
+    def test_create_multirow(self):
+        'Test create with multiple rows'
+        pool = Pool()
+        Model = pool.get('test.modelstorage')
+        transaction = Transaction()
+        count = transaction.database.IN_MAX + 1
+
+        vlist = [{'name': str(i)} for i in range(count)]
+        # Add a record with a different set of columns
+        vlist.insert(count // 2, {})
+        records = Model.create(vlist)
+
+        self.assertEqual(len(records), len(vlist))
+        self.assertEqual(len(set(records)), len(vlist))
+        self.assertEqual(sorted(r.id for r in records),
+            [r.id for r in records])
+        self.assertEqual([r.name for r in records],
+            [v.get('name') for v in vlist])
+
+    @with_transaction()
+    def test_references(self):
+        'Test references of the pool'
+        pool = Pool()
+
+        references = pool.get_references('test.many2one_target')
+        for reference in [
+                ('test.many2one_domainvalidation', 'many2one'),
+                ('test.many2one_orderby', 'many2one'),
+                ('test.many2one_search', 'many2one'),
+                ]:
+            self.assertIn(reference, references)
+        self.assertNotIn(('test.many2one_tree', 'many2one'), references)
+        self.assertEqual(pool.get_references('test.modelsql'), [])
+
+    @with_transaction()
+    def test_delete_set_null_references(self):
+        'Test delete of records referenced with SET NULL'
+        pool = Pool()
+        Target = pool.get('test.many2one_target')
+        Model = pool.get('test.many2one_search')
+
+        target, = Target.create([{'value': 1}])
+        record, = Model.create([{'many2one': target.id}])
+        Target.delete([target])
+
+        self.assertIsNone(Model(record.id).many2one)
+
+    @with_transaction()
+    def test_read_related_many2one_shared(self):
+        'Test read of related Many2One fields shared by many records'
+        pool = Pool()
+        Target = pool.get('test.many2one_target')
+        Model = pool.get('test.many2one_search')
+
+        targets = Target.create([{'value': i} for i in range(3)])
+        records = Model.create(
+            [{'many2one': targets[i % 3].id} for i in range(30)])
+        ids = [r.id for r in records]
+
+        with patch.object(Target, 'read', wraps=Target.read) as read:
+            result = Model.read(ids, ['many2one.value'])
+            self.assertEqual(read.call_count, 1)
+            target_ids, _ = read.call_args[0]
+            self.assertEqual(sorted(target_ids),
+                sorted(t.id for t in targets))
+        self.assertEqual([r['many2one.value'] for r in result],
+            [i % 3 for i in range(30)])
+
+    @with_transaction()
+    def test_search_iter(self):
+        'Test search_iter'
+        pool = Pool()
+        Model = pool.get('test.modelstorage')
+        size = Transaction().database.IN_MAX
+
+        Model.create([{'name': str(i % 7)} for i in range(2 * size + 1)])
+
+        self.assertEqual(list(Model.search_iter([])),
+            Model.search([], order=[('id', 'ASC')]))
+        self.assertEqual(
+            list(Model.search_iter([], order=[('id', 'DESC')])),
+            Model.search([], order=[('id', 'DESC')]))
+        domain = [('name', '!=', '3')]
+        order = [('name', 'ASC'), ('id', 'DESC')]
+        self.assertEqual(list(Model.search_iter(domain, order=order)),
+            Model.search(domain, order=order))
+        self.assertEqual(list(Model.search_iter([('name', '=', 'foo')])), [])
+
+    @with_transaction()
+    def test_register_fingerprint(self):
+        'Test __register__ skips unchanged table definition'
+        pool = Pool()
+        Model = pool.get('test.modelsql')
+        Fingerprint = pool.get('ir.model.fingerprint')
+        TableHandler = backend.get('TableHandler')
+
+        self.assertEqual(
+            Fingerprint.get_fingerprint('test.modelsql', 'tests'),
+            Model._fingerprint())
+
+        with patch.object(TableHandler, '__init__') as init:
+            Model.__register__('tests')
+            self.assertFalse(init.called)
+
+        Fingerprint.set_fingerprint('test.modelsql', 'tests', 'changed')
+        with patch.object(TableHandler, '__init__',
+                side_effect=TableHandler.__init__, autospec=True) as init:
+            Model.__register__('tests')
+            self.assertTrue(init.called)
+        self.assertEqual(
+            Fingerprint.get_fingerprint('test.modelsql', 'tests'),
+            Model._fingerprint())
+
+    @with_transaction()
+    def test_get_fingerprint_loaded_once(self):
+        'Test fingerprints are loaded once per transaction'
+        pool = Pool()
+        Fingerprint = pool.get('ir.model.fingerprint')
+        TableHandler = backend.get('TableHandler')
+
+        fingerprint = Fingerprint.get_fingerprint('test.modelsql', 'tests')
+        with patch.object(TableHandler, 'table_exist') as table_exist, \
+                patch.object(Transaction().connection, 'cursor') as cursor:
+            self.assertEqual(
+                Fingerprint.get_fingerprint('test.modelsql', 'tests'),
+                fingerprint)
+            self.assertIsNotNone(
+                Fingerprint.get_fingerprint('res.user', 'res'))
+            self.assertFalse(table_exist.called)
+            self.assertFalse(cursor.called)
+
+    @with_transaction()
+    def test_fingerprint(self):
+        'Test fingerprint changes with the table definition'
+        pool = Pool()
+        Model = pool.get('test.modelsql')
+
+        fingerprint = Model._fingerprint()
+        with patch.object(Model._fields['desc'], 'required', False):
+            self.assertNotEqual(Model._fingerprint(), fingerprint)
+        with patch.object(Model._fields['desc'], 'select', True):
+            self.assertNotEqual(Model._fingerprint(), fingerprint)
+        with patch('trytond.model.modelsql.__version__', '0.0.0'):
+            self.assertNotEqual(Model._fingerprint(), fingerprint)
+        with patch.object(backend, 'name', return_value='other'):
+            self.assertNotEqual(Model._fingerprint(), fingerprint)
+        self.assertEqual(Model._fingerprint(), fingerprint)
+
+    @with_transaction()
+    def test_read_cached_query(self):
+        'Test read uses the cached query'
+        pool = Pool()
+        Model = pool.get('test.modelstorage')
+
+        records = Model.create([{'name': str(i)} for i in range(6)])
+        ids = [r.id for r in records]
+        Model._sql_cache.clear()
+
+        self.assertEqual(
+            [r['name'] for r in Model.read(ids[:3], ['name'])],
+            ['0', '1', '2'])
+        self.assertEqual(len(Model._sql_cache), 1)
+
+        built = []
+        cached_query = Model._cached_query
+
+        def build_spy(key, build, values):
+            def spy(*args):
+                built.append(key)
+                return build(*args)
+            return cached_query(key, spy, values)
+        with patch.object(Model, '_cached_query', side_effect=build_spy):
+            self.assertEqual(
+                [r['name'] for r in Model.read(ids[3:], ['name'])],
+                ['3', '4', '5'])
+        self.assertEqual(built, [])
+        self.assertEqual(len(Model._sql_cache), 1)
+
+        Model.read(ids, ['name'])
+        if not Transaction().database.has_array():
+            self.assertEqual(len(Model._sql_cache), 2)
+        else:
+            self.assertEqual(len(Model._sql_cache), 1)
+
+    @with_transaction()
+    def test_cached_query_threads(self):
+        'Test cached query shared by threads'
+        pool = Pool()
+        Model = pool.get('test.modelstorage')
+        size_limit = Model._sql_cache.size_limit
+        errors = []
+
+        def build(value):
+            return 'SELECT %s', (value,)
+
+        def run(start):
+            try:
+                for i in range(start, start + 10 * size_limit):
+                    sql, params = Model._cached_query(i % (2 * size_limit),
+                        build, [i])
+                    self.assertEqual(params, [i])
+            except Exception, exception:
+                errors.append(exception)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(Model._sql_cache), size_limit)
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(ModelSQLTestCase)
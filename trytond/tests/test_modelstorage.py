@@ -3,8 +3,12 @@
 
 import unittest
 
+from mock import patch
+
+from trytond.model.modelstorage import _RecordIds
 from trytond.pool import Pool
 from trytond.tests.test_tryton import install_module, with_transaction
+from trytond.transaction import Transaction
 
 
 class ModelStorageTestCase(unittest.TestCase):
@@ -34,6 +38,48 @@ class ModelStorageTestCase(unittest.TestCase):
         self.assertTrue(
             all(x['name'] >= y['name'] for x, y in zip(rows, rows[1:])))
 
+    @with_transaction()
+    def test_browse_siblings(self):
+        'Test browse loads siblings from the position of the record'
+        pool = Pool()
+        ModelStorage = pool.get('test.modelstorage')
+
+        records = ModelStorage.create(
+            [{'name': str(i)} for i in range(10)])
+        records = ModelStorage.browse([r.id for r in records])
+
+        self.assertEqual(records[5].name, '5')
+        self.assertEqual([r.name for r in records], map(str, range(10)))
+
+    @with_transaction()
+    def test_browse_iteration_siblings(self):
+        'Test iteration over browsed records reads each window once'
+        pool = Pool()
+        ModelStorage = pool.get('test.modelstorage')
+        size = Transaction().database.IN_MAX
+        count = 3 * size + 5
+
+        records = ModelStorage.create(
+            [{'name': str(i)} for i in range(count)])
+        ids = [r.id for r in records]
+
+        scanned = []
+        siblings = _RecordIds.siblings
+
+        def count_siblings(self, id_):
+            for sibling in siblings(self, id_):
+                scanned.append(sibling)
+                yield sibling
+
+        with patch.object(_RecordIds, 'siblings', count_siblings), \
+                patch.object(ModelStorage, 'read',
+                    wraps=ModelStorage.read) as read:
+            names = [r.name for r in ModelStorage.browse(ids)]
+        self.assertEqual(names, map(str, range(count)))
+        self.assertEqual(read.call_count, (count + size - 1) // size)
+        # Each lookup starts from the record position
+        self.assertLessEqual(len(scanned), 2 * count)
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(ModelStorageTestCase)
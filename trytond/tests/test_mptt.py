@@ -201,6 +201,53 @@ class MPTTTestCase(unittest.TestCase):
                     }])
         self.check_tree()
 
+    @with_transaction()
+    def test_create_incremental(self):
+        'Test create under existing parents does not rebuild'
+        pool = Pool()
+        Mptt = pool.get('test.mptt')
+
+        self.create()
+        records = Mptt.search([])
+        with patch.object(Mptt, '_rebuild_tree') as rebuild:
+            Mptt.create([{
+                        'name': 'Test incremental %d' % i,
+                        'parent': record.id,
+                        'childs': [('create', [{
+                                        'name': 'Test incremental child',
+                                        }])],
+                        } for i, record in enumerate(records[::4])]
+                + [{'name': 'Test incremental root'}])
+            self.assertFalse(rebuild.called)
+        self.check_tree()
+
+        for parent in records[::4]:
+            self.assertEqual(
+                Mptt.search([('parent', 'child_of', [parent.id])]),
+                Mptt.search([
+                        ('left', '>=', parent.left),
+                        ('right', '<=', parent.right),
+                        ]))
+
+    @with_transaction()
+    def test_rebuild(self):
+        'Test rebuild tree'
+        pool = Pool()
+        Mptt = pool.get('test.mptt')
+        table = Mptt.__table__()
+        cursor = Transaction().connection.cursor()
+
+        self.create()
+        records = Mptt.search([], order=[('left', 'ASC')])
+        values = [(r.id, r.left, r.right) for r in records]
+        cursor.execute(*table.update([table.left, table.right], [0, 0]))
+
+        Mptt._rebuild_tree('parent', None, 0)
+        self.check_tree()
+        cursor.execute(*table.select(table.id, table.left, table.right,
+                order_by=table.left.asc))
+        self.assertEqual(cursor.fetchall(), values)
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(MPTTTestCase)
@@ -3,9 +3,20 @@
 
 import unittest
 import json
+import base64
 import datetime
 from decimal import Decimal
 
+from mock import patch
+from werkzeug.test import Client
+from werkzeug.wrappers import BaseResponse, Response
+
+from trytond import __version__
+from trytond.application import app
+from trytond.pool import Pool
+from trytond.transaction import Transaction
+from trytond.cache import Cache
+from trytond.tests.test_tryton import install_module, DB_NAME
 from trytond.protocols.jsonrpc import JSONEncoder, JSONDecoder, JSONRequest
 from trytond.protocols.xmlrpc import client, XMLRequest
 
@@ -22,6 +33,48 @@ class JSONTestCase(unittest.TestCase):
             {'method': 'method', 'params': ['foo', 'bar']})
         self.assertEqual(req.method, 'method')
         self.assertEqual(req.params, ['foo', 'bar'])
+        self.assertEqual(req.batch, None)
+
+    def test_json_batch_request(self):
+        'Test JSON batch request'
+        req = JSONRequest.from_values(
+            data=b'[{"id": 1, "method": "foo", "params": []}, '
+            b'{"id": 2, "method": "bar", "params": ["baz"]}]',
+            content_type='text/json',
+            )
+        foo, bar = req.batch
+        self.assertEqual(foo.method, 'foo')
+        self.assertEqual(foo.params, [])
+        self.assertEqual(bar.method, 'bar')
+        self.assertEqual(bar.params, ['baz'])
+        self.assertEqual(bar.batch, None)
+
+    def test_json_batch_response(self):
+        'Test JSON batch response'
+        client = Client(app, BaseResponse)
+        response = client.post('/', content_type='text/json',
+            data=json.dumps([
+                    {'id': 1, 'method': 'common.server.version',
+                        'params': []},
+                    {'id': 2, 'method': 'unknown', 'params': []},
+                    ]))
+        version, unknown = json.loads(response.data)
+        self.assertEqual(version, {'id': 1, 'result': __version__})
+        self.assertEqual(unknown['id'], 2)
+        self.assertIn('error', unknown)
+
+    def test_json_batch_error_handler(self):
+        'Test JSON batch response with error handler'
+        client = Client(app, BaseResponse)
+        handler = lambda e: Response('handled', status=409)
+        with patch.object(app, 'error_handlers', [handler]):
+            response = client.post('/', content_type='text/json',
+                data=json.dumps([
+                        {'id': 1, 'method': 'unknown', 'params': []},
+                        ]))
+        unknown, = json.loads(response.data)
+        self.assertEqual(unknown,
+            {'id': 1, 'error': ['409 CONFLICT', 'handled']})
 
     def dumps_loads(self, value):
         self.assertEqual(json.loads(
@@ -89,8 +142,77 @@ class XMLTestCase(unittest.TestCase):
         self.dumps_loads(None)
 
 
+class JSONBatchTestCase(unittest.TestCase):
+    'Test JSON batch on database'
+
+    @classmethod
+    def setUpClass(cls):
+        install_module('tests')
+
+    def setUp(self):
+        with Transaction().start(DB_NAME, 1) as transaction:
+            Session = Pool().get('ir.session')
+            session, = Session.create([{}])
+            key = session.key
+            transaction.commit()
+        self.client = Client(app, BaseResponse)
+        self.headers = {
+            'Authorization': 'Session ' + base64.b64encode(
+                'admin:1:%s' % key),
+            }
+
+    def test_batch_database(self):
+        'Test authenticated batch on database'
+        calls = [
+            {'id': 1, 'method': 'model.res.user.get_preferences',
+                'params': [True, {}]},
+            {'id': 2, 'method': 'model.ir.lang.search_count',
+                'params': [[('code', '=', 'en_US')], {}]},
+            {'id': 3, 'method': 'model.res.user.set_preferences',
+                'params': [{}, {}]},
+            ]
+        with patch.object(Transaction, 'start',
+                autospec=True, side_effect=Transaction.start) as start:
+            response = self.client.post('/%s/' % DB_NAME,
+                content_type='text/json', headers=self.headers,
+                data=json.dumps(calls))
+        preferences, count, set_preferences = json.loads(response.data)
+        self.assertEqual(preferences['id'], 1)
+        self.assertIn('result', preferences)
+        self.assertEqual(count, {'id': 2, 'result': 1})
+        self.assertEqual(set_preferences, {'id': 3, 'result': None})
+        readonly = [c for c in start.call_args_list
+            if c[1].get('readonly') and c[0][2] == 1]
+        # The readonly calls share one transaction
+        self.assertEqual(len(readonly), 1)
+
+    def test_session_clean_once(self):
+        'Test caches are cleaned once for a session request'
+        with patch.object(Cache, 'clean') as clean:
+            response = self.client.post('/%s/' % DB_NAME,
+                content_type='text/json', headers=self.headers,
+                data=json.dumps({'id': 1,
+                        'method': 'model.ir.lang.search_count',
+                        'params': [[('code', '=', 'en_US')], {}]}))
+        self.assertEqual(json.loads(response.data), {'id': 1, 'result': 1})
+        clean.assert_called_once_with(DB_NAME)
+
+    def test_batch_database_unauthorized(self):
+        'Test batch on database without authorization'
+        response = self.client.post('/%s/' % DB_NAME,
+            content_type='text/json',
+            data=json.dumps([
+                    {'id': 1, 'method': 'model.res.user.get_preferences',
+                        'params': [True, {}]},
+                    ]))
+        call, = json.loads(response.data)
+        self.assertIn('error', call)
+
+
 def suite():
     suite_ = unittest.TestSuite()
     suite_.addTests(unittest.TestLoader().loadTestsFromTestCase(JSONTestCase))
     suite_.addTests(unittest.TestLoader().loadTestsFromTestCase(XMLTestCase))
+    suite_.addTests(
+        unittest.TestLoader().loadTestsFromTestCase(JSONBatchTestCase))
     return suite_
@@ -4,6 +4,10 @@
 
 import unittest
 import datetime
+from collections import OrderedDict
+
+from mock import patch
+
 from trytond import pyson
 
 
@@ -598,6 +602,62 @@ class PYSONTestCase(unittest.TestCase):
             self.assertEqual(decoder.decode(encoder.encode(instance)).pyson(),
                 instance.pyson())
 
+    def test_evaluator(self):
+        'Test evaluator returns the same values as the decoder'
+        encoder = pyson.PYSONEncoder()
+        contexts = [{}, {
+                'test': 1,
+                'foo': 'bar',
+                'list': [1, 2],
+                'context': {'company': 1, 'date': datetime.date(2010, 1, 1)},
+                }]
+
+        for instance in [
+                pyson.Eval('test', 0),
+                pyson.Eval('context', {}).get('company', -1),
+                pyson.Not(pyson.Bool(pyson.Eval('test', False))),
+                pyson.And(pyson.Bool(pyson.Eval('test')), True),
+                pyson.Or(False, pyson.Equal(pyson.Eval('foo'), 'bar')),
+                pyson.Greater(pyson.Eval('test', 0), 0, True),
+                pyson.Less(pyson.Eval('test', 0), 2),
+                pyson.If(pyson.In('foo', pyson.Eval('context', {})),
+                    ['foo'], ['bar', 1]),
+                pyson.In(pyson.Eval('test'), pyson.Eval('list', [])),
+                pyson.Date(2010, 1, 31, delta_months=1),
+                pyson.DateTime(2010, 1, 1, 12, 30, 0, 0, delta_hours=-1),
+                pyson.Len(pyson.Eval('list', [])),
+                [('company', '=', pyson.Eval('context', {}).get('company')),
+                    ('date', '<=', datetime.date(2010, 1, 1)),
+                    {1: 'one', u'__class__': 'Unknown'}],
+                ]:
+            encoded = encoder.encode(instance)
+            for context in contexts:
+                result = pyson.evaluator(encoded)(context)
+                self.assertEqual(result,
+                    pyson.PYSONDecoder(context).decode(encoded))
+                self.assertEqual(type(result),
+                    type(pyson.PYSONDecoder(context).decode(encoded)))
+        self.assertEqual(
+            pyson.evaluator(encoder.encode(pyson.Eval('test', 0)))(), 0)
+
+    def test_evaluator_cache(self):
+        'Test evaluator is cached and returns new values'
+        encoded = pyson.PYSONEncoder().encode([('id', '=', 1)])
+
+        evaluate = pyson.evaluator(encoded)
+        self.assertIs(pyson.evaluator(encoded), evaluate)
+        result = evaluate({})
+        result.append('foo')
+        self.assertEqual(evaluate({}), [['id', '=', 1]])
+
+    def test_evaluator_cache_size(self):
+        'Test evaluator cache size is limited'
+        with patch.object(pyson, '_EVALUATORS_MAX', 2), \
+                patch.object(pyson, '_evaluators', OrderedDict()):
+            for i in range(3):
+                pyson.evaluator(pyson.PYSONEncoder().encode(i))
+            self.assertEqual(pyson._evaluators.keys(), ['1', '2'])
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(PYSONTestCase)
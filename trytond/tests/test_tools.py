@@ -7,6 +7,7 @@ import doctest
 import datetime
 import sql
 import sql.operators
+from mock import patch, Mock
 
 from trytond.tools import reduce_ids, datetime_strftime, \
     reduce_domain, decimal_, is_instance_method
@@ -59,6 +60,16 @@ class ToolsTestCase(unittest.TestCase):
                 | (self.table.id.in_([15.0, 18.0, 19.0, 21.0]))))
         self.assertRaises(AssertionError, reduce_ids, self.table.id, [1.1])
 
+    @patch('trytond.transaction.Transaction.database', Mock(
+            **{'has_array.return_value': True}))
+    def test_reduce_ids_array(self):
+        'Test reduce_ids with array'
+        expression = reduce_ids(self.table.id, [1.0, 3, 2, 10])
+        self.assertIsInstance(expression, sql.operators.Equal)
+        self.assertIn('ANY(', str(expression))
+        self.assertEqual(expression.params, ([1, 3, 2, 10],))
+        self.assertEqual(reduce_ids(self.table.id, []), sql.Literal(False))
+
     def test_datetime_strftime(self):
         'Test datetime_strftime'
         self.assert_(datetime_strftime(datetime.date(2005, 3, 2),
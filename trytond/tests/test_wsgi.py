@@ -0,0 +1,94 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import signal
+import unittest
+from mock import patch, Mock, call
+
+from trytond.wsgi import run_workers, _respawn_limit
+
+
+class WSGITestCase(unittest.TestCase):
+    'Test WSGI'
+
+    @patch('trytond.wsgi.time')
+    @patch('trytond.wsgi.os')
+    def test_run_workers(self, os_, time_):
+        'Test workers are forked and replaced'
+        time_.time.side_effect = [0, 0, 100, 100]
+        os_.fork.side_effect = [10, 11, 12]
+        os_.wait.side_effect = [(10, 0), (99, 0), KeyboardInterrupt]
+        server = Mock()
+        handler = signal.getsignal(signal.SIGTERM)
+
+        run_workers(server, 2)
+
+        self.assertEqual(os_.fork.call_count, 3)
+        self.assertEqual(sorted(os_.kill.call_args_list), [
+                call(11, signal.SIGTERM), call(12, signal.SIGTERM)])
+        self.assertEqual(os_.waitpid.call_count, 2)
+        self.assertFalse(server.serve_forever.called)
+        server.server_close.assert_called_once_with()
+        self.assertEqual(signal.getsignal(signal.SIGTERM), handler)
+        self.assertFalse(time_.sleep.called)
+
+    @patch('trytond.wsgi.time')
+    @patch('trytond.wsgi.os')
+    def test_run_workers_respawn_limit(self, os_, time_):
+        'Test workers failing at start are delayed then stopped'
+        time_.time.return_value = 0
+        os_.fork.side_effect = range(10, 20)
+        os_.wait.side_effect = [(p, 256) for p in range(10, 20)]
+        server = Mock()
+
+        with self.assertRaises(SystemExit) as cm:
+            run_workers(server, 1)
+
+        self.assertEqual(cm.exception.code, 1)
+        self.assertEqual(os_.fork.call_count, _respawn_limit)
+        self.assertEqual(time_.sleep.call_args_list,
+            [call(i) for i in range(1, _respawn_limit)])
+        server.server_close.assert_called_once_with()
+
+    @patch('trytond.wsgi.time')
+    @patch('trytond.wsgi.os')
+    def test_run_workers_respawn_reset(self, os_, time_):
+        'Test failures are reset by a worker which ran long enough'
+        time_.time.side_effect = [0, 0, 0, 100, 100, 100, 100]
+        os_.fork.side_effect = [10, 11, 12, 13]
+        os_.wait.side_effect = [(10, 256), (11, 0), (12, 256),
+            KeyboardInterrupt]
+        server = Mock()
+
+        run_workers(server, 1)
+
+        self.assertEqual(os_.fork.call_count, 4)
+        self.assertEqual(time_.sleep.call_args_list, [call(1), call(1)])
+
+    @patch('trytond.wsgi.os')
+    def test_run_workers_child(self, os_):
+        'Test worker serves the requests'
+        os_.fork.return_value = 0
+        os_._exit.side_effect = SystemExit
+        server = Mock()
+
+        run_workers(server, 2)
+
+        server.serve_forever.assert_called_once_with()
+        os_._exit.assert_called_once_with(0)
+
+    @patch('trytond.wsgi.os')
+    def test_run_workers_child_failure(self, os_):
+        'Test worker failing to serve exits with an error status'
+        os_.fork.return_value = 0
+        os_._exit.side_effect = SystemExit
+        server = Mock()
+        server.serve_forever.side_effect = Exception
+
+        with patch('trytond.wsgi.logger'):
+            run_workers(server, 2)
+
+        os_._exit.assert_called_once_with(1)
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(WSGITestCase)
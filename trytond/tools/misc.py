@@ -15,6 +15,7 @@ import warnings
 
 from sql import Literal
 from sql.operators import Or
+from sql.functions import Function
 
 from trytond.const import OPERATORS
 
@@ -191,16 +192,33 @@ def mod10r(number):
     return result + str((10 - report) % 10)
 
 
+class _Any(Function):
+    __slots__ = ()
+    _function = 'ANY'
+
+
+def array_ids(field, ids):
+    '''
+    Return the SQL expression of the column equal to any of the array of ids
+    '''
+    return field == _Any(ids)
+
+
 def reduce_ids(field, ids):
     '''
     Return a small SQL expression for the list of ids and the sql column
     '''
+    from trytond.transaction import Transaction
     ids = list(ids)
     if not ids:
         return Literal(False)
     assert all(x.is_integer() for x in ids if isinstance(x, float)), \
         'ids must be integer'
     ids = map(int, ids)
+    database = Transaction().database
+    if database and database.has_array():
+        # The same statement is used for any list of ids
+        return array_ids(field, ids)
     ids.sort()
     prev = ids.pop(0)
     continue_list = [prev, prev]
@@ -186,6 +186,9 @@ class Transaction(object):
             self.rollback()
             raise
         else:
+            if not self.readonly and self.counter:
+                # Let the next reads see the committed writes
+                self.database.use_primary()
             try:
                 for datamanager in self._datamanagers:
                     datamanager.tpc_finish(self)
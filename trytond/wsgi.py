@@ -1,10 +1,14 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+import os
+import sys
+import signal
+import time
 import logging
 
 from werkzeug.wrappers import Response
 from werkzeug.routing import Map, Rule
-from werkzeug.exceptions import abort
+from werkzeug.exceptions import abort, HTTPException
 
 import wrapt
 
@@ -12,10 +16,15 @@ from trytond.protocols.wrappers import Request
 from trytond.protocols.jsonrpc import JSONProtocol
 from trytond.protocols.xmlrpc import XMLProtocol
 
-__all__ = ['TrytondWSGI', 'app']
+__all__ = ['TrytondWSGI', 'app', 'run_workers']
 
 logger = logging.getLogger(__name__)
 
+# A worker which exits less than _respawn_window seconds after its start
+# counts as a failure
+_respawn_window = 10
+_respawn_limit = 5
+
 
 class TrytondWSGI(object):
 
@@ -51,6 +60,21 @@ class TrytondWSGI(object):
                     response = rv
             return response
 
+    def dispatch_batch(self, request):
+        adapter = self.url_map.bind_to_environ(request.environ)
+        try:
+            # The calls share the user of the batch request
+            _, request.view_args = adapter.match()
+        except HTTPException:
+            # Reported by each call
+            pass
+        try:
+            return [self.dispatch_request(r) for r in request.batch]
+        finally:
+            for transaction in request.batch_transactions.itervalues():
+                with transaction.set_current_transaction(transaction):
+                    pass
+
     def wsgi_app(self, environ, start_response):
         for cls in self.protocols:
             if cls.content_type in environ.get('CONTENT_TYPE', ''):
@@ -58,7 +82,10 @@ class TrytondWSGI(object):
                 break
         else:
             request = Request(environ)
-        data = self.dispatch_request(request)
+        if request.batch is not None:
+            data = self.dispatch_batch(request)
+        else:
+            data = self.dispatch_request(request)
         if not isinstance(data, Response):
             for cls in self.protocols:
                 for mimetype in request.accept_mimetypes:
@@ -84,3 +111,72 @@ class TrytondWSGI(object):
         return self.wsgi_app(environ, start_response)
 
 app = TrytondWSGI()
+
+
+def run_workers(server, workers):
+    '''
+    Serve the requests of server with workers forked from the current
+    process. The workers share the listening socket and the memory of the
+    initialized pools. A worker which exits is replaced until the process is
+    interrupted or terminated. The replacement of workers which exit soon
+    after their start is delayed and stops after _respawn_limit failures in
+    a row.
+    '''
+    children = {}
+
+    def spawn():
+        pid = os.fork()
+        if not pid:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            status = 1
+            try:
+                server.serve_forever()
+                status = 0
+            except Exception:
+                logger.error('worker failed', exc_info=True)
+            finally:
+                os._exit(status)
+        children[pid] = time.time()
+
+    def terminate(signum, frame):
+        sys.exit(0)
+
+    failures = 0
+    previous = signal.signal(signal.SIGTERM, terminate)
+    try:
+        for _ in range(workers):
+            spawn()
+        logger.info('started %s workers', workers)
+        while True:
+            pid, status = os.wait()
+            if pid in children:
+                started = children.pop(pid)
+                logger.warning('worker %s exited with status %s', pid, status)
+                if time.time() - started < _respawn_window:
+                    failures += 1
+                    if failures >= _respawn_limit:
+                        logger.critical(
+                            'workers exited %s times after their start',
+                            failures)
+                        break
+                    time.sleep(failures)
+                else:
+                    failures = 0
+                spawn()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        server.server_close()
+    if failures >= _respawn_limit:
+        sys.exit(1)